@@ -128,6 +128,24 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 
+# --- CACHES ---
+# 'retail_queries' holds the answers of chat data queries (see hub/ai_chatter.py).
+# LocMemCache is per-process and evicts the least recently used entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'retail_queries': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'retail-queries',
+        'TIMEOUT': int(os.environ.get('RETAIL_QUERY_CACHE_TTL', 3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RETAIL_QUERY_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
+
 # Default primary key field type (Unchanged)
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -136,5 +154,79 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # It now safely reads from your .env file
 GOOGLE_AI_API_KEY = os.environ.get('GOOGLE_AI_API_KEY')
 
+# --- SHARED GEMINI CLIENT (hub/llm_client.py) ---
+GOOGLE_AI_MODEL = os.environ.get('GOOGLE_AI_MODEL', 'gemini-2.5-flash-preview-09-2025')
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 30)) # Per attempt
+# The whole call: queueing, every attempt and the backoff between them (below the 60s request limit)
+LLM_DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS', 50))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2)) # On timeouts, 429s and 5xx
+LLM_MAX_CONCURRENT = int(os.environ.get('LLM_MAX_CONCURRENT', 4)) # Calls in flight per process
+LLM_MAX_CALLS_PER_MINUTE = int(os.environ.get('LLM_MAX_CALLS_PER_MINUTE', 60)) # Per process
+LLM_QUEUE_SECONDS = float(os.environ.get('LLM_QUEUE_SECONDS', 20)) # Max wait for a free slot
+# Identical prompts are answered from the database (LLMResponse) instead of Gemini
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 10000)) # Least recently used go first
+
+# Chat messages classified locally (hub/chat_intent.py) with at least this
+# confidence skip the Gemini classification call; 1.1 always asks Gemini
+CHAT_INTENT_MIN_CONFIDENCE = float(os.environ.get('CHAT_INTENT_MIN_CONFIDENCE', 0.7))
+# One Gemini call per chat message (intent + JSON query + reply template together)
+# instead of up to three; the number in the reply is still computed by pandas
+CHAT_SINGLE_CALL = os.environ.get('CHAT_SINGLE_CALL', 'false').lower() == 'true'
+# Phrase data answers with Gemini instead of the local templates (hub/chat_replies.py)
+CHAT_LLM_NATURALIZER = os.environ.get('CHAT_LLM_NATURALIZER', 'false').lower() == 'true'
+
 # --- This tells @login_required where to send users.
 LOGIN_URL = 'login'
+
+
+# --- RETAIL INSIGHT ENGINE ---
+# Memory budget (in bytes) for the process-wide DataFrame cache
+RETAIL_DATAFRAME_CACHE_BYTES = int(os.environ.get('RETAIL_DATAFRAME_CACHE_BYTES', 512 * 1024 * 1024))
+
+# How the ingested dataset is stored next to the upload:
+# 'parquet' = compressed sidecar, each worker keeps its own copy in RAM
+# 'mmap'    = Arrow IPC file that all gunicorn workers memory-map (one shared copy)
+RETAIL_DATASET_STORAGE = os.environ.get('RETAIL_DATASET_STORAGE', 'parquet')
+
+# Uploads are ingested in batches of this many rows, so peak memory stays
+# bounded no matter how big the file is
+RETAIL_INGEST_CHUNK_ROWS = int(os.environ.get('RETAIL_INGEST_CHUNK_ROWS', 100000))
+
+# Optional OLAP cube built at ingest: sum/count of every numeric column for
+# every combination of up to RETAIL_CUBE_MAX_DIMS categorical columns that
+# have at most RETAIL_CUBE_MAX_CARDINALITY distinct values
+RETAIL_CUBE_ENABLED = os.environ.get('RETAIL_CUBE_ENABLED', 'false').lower() == 'true'
+RETAIL_CUBE_MAX_DIMS = int(os.environ.get('RETAIL_CUBE_MAX_DIMS', 2))
+RETAIL_CUBE_MAX_CARDINALITY = int(os.environ.get('RETAIL_CUBE_MAX_CARDINALITY', 50))
+
+# Threads used to run the dashboard's groupby passes (one per distinct x_col)
+RETAIL_DASHBOARD_WORKERS = int(os.environ.get('RETAIL_DASHBOARD_WORKERS', 4))
+
+# Processes used by segmented forecasts (one SARIMA fit per segment)
+RETAIL_FORECAST_WORKERS = int(os.environ.get('RETAIL_FORECAST_WORKERS', os.cpu_count() or 1))
+
+# The forecast page uses SARIMA only if it fits within this many seconds,
+# and never on series longer than RETAIL_FORECAST_SARIMA_MAX_MONTHS;
+# otherwise it uses the fast Holt-Winters model
+RETAIL_FORECAST_BUDGET_SECONDS = float(os.environ.get('RETAIL_FORECAST_BUDGET_SECONDS', 10))
+RETAIL_FORECAST_SARIMA_MAX_MONTHS = int(os.environ.get('RETAIL_FORECAST_SARIMA_MAX_MONTHS', 240))
+
+# Below this confidence (0-1), the local forecast-column detector asks the AI
+RETAIL_FORECAST_COLUMNS_MIN_CONFIDENCE = float(os.environ.get('RETAIL_FORECAST_COLUMNS_MIN_CONFIDENCE', 0.6))
+
+# Auto-tuning: search for the best SARIMA order (cross-validated, in parallel)
+# the first time a file is forecast, within this many seconds
+RETAIL_FORECAST_AUTO_ORDER = os.environ.get('RETAIL_FORECAST_AUTO_ORDER', 'false').lower() == 'true'
+RETAIL_FORECAST_SEARCH_BUDGET_SECONDS = float(os.environ.get('RETAIL_FORECAST_SEARCH_BUDGET_SECONDS', 60))
+
+# --- BACKGROUND JOBS ---
+# Slow tasks (feedback analysis, forecasts) are queued in the database and run
+# by `python manage.py run_jobs`. Set BACKGROUND_JOBS_INLINE=true to run them
+# inside the request instead (e.g. when no worker process is running).
+BACKGROUND_JOBS_INLINE = os.environ.get('BACKGROUND_JOBS_INLINE', 'false').lower() == 'true'
+BACKGROUND_JOBS_POLL_SECONDS = float(os.environ.get('BACKGROUND_JOBS_POLL_SECONDS', 2))
+# A job 'running' for longer than this is taken to have lost its worker (crash, OOM) and is failed
+BACKGROUND_JOBS_STALE_SECONDS = int(os.environ.get('BACKGROUND_JOBS_STALE_SECONDS', 30 * 60))
+BACKGROUND_JOBS_KEEP_DAYS = int(os.environ.get('BACKGROUND_JOBS_KEEP_DAYS', 7)) # Finished jobs are deleted after this
@@ -4,11 +4,27 @@ from .models import (
     UploadedFile, 
     AnalysisResult,
     RetailFile,
-    ChatMessage
+    ChatMessage,
+    DashboardLayout,
+    DashboardChartData,
+    SalesForecast,
+    ForecastOrder,
+    ForecastColumns,
+    LLMResponse,
+    LLMCacheStats,
+    BackgroundJob
 )
 
 # Register your models here.
 admin.site.register(UploadedFile)
 admin.site.register(AnalysisResult)
 admin.site.register(RetailFile)
-admin.site.register(ChatMessage)
\ No newline at end of file
+admin.site.register(ChatMessage)
+admin.site.register(DashboardLayout)
+admin.site.register(DashboardChartData)
+admin.site.register(SalesForecast)
+admin.site.register(ForecastOrder)
+admin.site.register(ForecastColumns)
+admin.site.register(LLMResponse)
+admin.site.register(LLMCacheStats)
+admin.site.register(BackgroundJob)
@@ -1,8 +1,6 @@
-import google.generativeai as genai
-from django.conf import settings
 from .models import UploadedFile, AnalysisResult
 from .utils import read_file_content
-import json
+from .llm_client import generate_text, is_configured, parse_json_response
 
 def perform_analysis(uploaded_file_id):
     """
@@ -27,16 +25,9 @@ def perform_analysis(uploaded_file_id):
         print(f"Could not read content: {text_content}")
         return
 
-    api_key = settings.GOOGLE_AI_API_KEY
-    if not api_key:
+    if not is_configured():
         print("GOOGLE_AI_API_KEY not found in settings.py")
         return
-        
-    genai.configure(api_key=api_key)
-    
-    # --- THIS IS THE FIX: Reverted to the Flash model ---
-    model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
-    # --- END OF FIX ---
 
     prompt = f"""
     You are a professional business analyst. I will provide you with a document
@@ -75,16 +66,7 @@ def perform_analysis(uploaded_file_id):
     print("Calling the Gemini Flash API...")
     try:
         # Removed the 'generation_config' as the prompt is now strict enough
-        response = model.generate_content(prompt)
-        ai_response_text = response.text.strip()
-        
-        # Clean the response to ensure it's valid JSON
-        if ai_response_text.startswith("```json"):
-            ai_response_text = ai_response_text[7:]
-        if ai_response_text.endswith("```"):
-            ai_response_text = ai_response_text[:-3]
-        
-        ai_json = json.loads(ai_response_text)
+        ai_json = generate_text(prompt, parse=parse_json_response)
         
         ai_summary = f"""
         Overall Sentiment: {ai_json.get('overall_sentiment', 'N/A')}
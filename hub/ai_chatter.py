@@ -1,26 +1,78 @@
-import google.generativeai as genai
 from django.conf import settings
 import pandas as pd
+import numpy as np
 from .models import RetailFile, ChatMessage
+from .retail_data import as_float64, get_dataset_version, get_value_index, load_retail_cube, load_retail_dataframe, resolve_columns
+from .retail_cube import execute_cube_query
+from .retail_index import ValueIndex, normalize_value
+from .chat_intent import GREETING, classify_intent
+from .chat_replies import naturalize_with_template
+from django.core.cache import caches
+import hashlib
 import json
+import re
 import io
 import sys
 
 # --- Global AI Configuration ---
-api_key = settings.GOOGLE_AI_API_KEY
-if api_key:
-    genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
+from .llm_client import generate_text, is_configured, parse_json_response
 # -----------------------------
 
+query_cache = caches['retail_queries']
+
+# The JSON queries that execute_json_query understands, and examples of them
+# (shared by the query prompt and the single-call prompt)
+QUERY_JSON_FORMATS = """
+    --- AVAILABLE JSON FORMATS ---
+    1.  For SUM or MEAN (with optional filters):
+        {"operation": "sum", "agg_col": "ACTUAL_COLUMN_NAME", "filters": [{"column": "COL_NAME", "value": "FILTER_VAL"}]}
+        (agg_func can be "sum" or "mean")
+        
+    2.  For COUNT (with optional filters):
+        {"operation": "count", "filters": [{"column": "COL_NAME", "value": "FILTER_VAL"}]}
+        
+    3.  For GROUPBY & FIND MAX/MEAN (e.g., "which brand sold most?"):
+        {"operation": "groupby_agg", "groupby_col": "GROUPBY_COLUMN", "agg_col": "AGGREGATE_COLUMN", "agg_func": "idxmax"}
+        (agg_func can be "idxmax" for "which is best" or "mean" for "average by group")
+        
+    4.  If you cannot understand or find a column:
+        {"operation": "clarify", "message": "I'm sorry, I couldn't find a column for [user's term]. Which column should I use?"}
+    ---
+"""
+
+QUERY_JSON_EXAMPLES = """
+    --- EXAMPLES (Based on schema in user's prompt) ---
+    
+    User: "Which brand generated the most revenue (Total Price)?"
+    AI: {"operation": "groupby_agg", "groupby_col": "Brand", "agg_col": "Total Price", "agg_func": "idxmax"}
+
+    User: "How many 'Negative' reviews did the 'Electronics' category receive?"
+    AI: {"operation": "count", "filters": [{"column": "ReviewSentiment", "value": "Negative"}, {"column": "Product Category", "value": "Electronics"}]}
+    
+    User: "What were the total sales for 'Clothing' in 'Chennai'?"
+    AI: {"operation": "sum", "agg_col": "Total Price", "filters": [{"column": "Product Category", "value": "Clothing"}, {"column": "CustomerCity", "value": "Chennai"}]}
+    
+    User: "Coimbatore-la, '18-25' age group la irukavanga ethana per UPI use pannirukanga?"
+    AI: {"operation": "count", "filters": [{"column": "CustomerCity", "value": "Coimbatore"}, {"column": "AgeGroup", "value": "18-25"}, {"column": "PaymentMethod", "value": "UPI"}]}
+    
+    User: "Which 'Product Category' has the highest average 'CustomerRating'?"
+    AI: {"operation": "groupby_agg", "groupby_col": "Product Category", "agg_col": "CustomerRating", "agg_func": "idxmax"}
+    
+    User: "What was the total profit?"
+    AI: {"operation": "clarify", "message": "I'm sorry, I couldn't find a 'Profit' column in your file. Which column should I use to calculate profit?"}
+    ---
+"""
+
 # --- THIS IS THE NEW, SAFER "NATURALIZER" ---
 def naturalize_response(user_message: str, data_answer: str):
     """
     AI Call #3: Turns a data-heavy answer into a natural, human-like response.
     This version has a very strict prompt to prevent hallucination.
+    Only used when settings.CHAT_LLM_NATURALIZER is on; otherwise answers
+    are phrased by naturalize_with_template (no AI call).
     """
     print(f"Naturalizing: Question='{user_message}', Answer='{data_answer}'")
-    if not api_key:
+    if not is_configured():
         return data_answer # Failsafe
 
     # If the answer is already a sentence, just return it.
@@ -65,16 +117,39 @@ def naturalize_response(user_message: str, data_answer: str):
     """
     
     try:
-        response = model.generate_content(naturalizer_prompt)
-        return response.text.strip()
+        return generate_text(naturalizer_prompt).strip()
     except Exception as e:
         print(f"Error during naturalization: {e}")
         return data_answer # Failsafe, just return the raw data
 
-def execute_json_query(df: pd.DataFrame, query_json: dict, user_message: str):
+def column_equals(series: pd.Series, value):
+    """
+    Case-insensitive equality filter for one column, as a NumPy boolean mask.
+    For categorical columns we only compare the (few) categories as text and
+    then filter on the integer codes, instead of lower-casing every row.
+    """
+    value = str(value).lower()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        matching_codes = [code for code, category in enumerate(series.cat.categories) if str(category).lower() == value]
+        return np.isin(series.cat.codes.to_numpy(), matching_codes)
+    return (series.astype(str).str.lower() == value).to_numpy()
+
+def select_rows(series: pd.Series, positions):
+    """
+    Projects one column onto the selected rows (positions=None means all rows).
+    Only this column is copied, never the whole DataFrame.
+    """
+    return series if positions is None else series.iloc[positions]
+
+def execute_json_query(df: pd.DataFrame, query_json: dict, user_message: str, value_index: ValueIndex = None):
     """
     Safely builds and executes a Pandas query from a JSON object.
     This function now returns ONLY the raw data answer (e.g., "148").
+    If a ValueIndex for this dataset is given, filters are answered from it.
+
+    The DataFrame itself is never copied or filtered: the filters are combined
+    into ONE selection of row positions, and only the agg_col/groupby_col
+    columns are projected onto it at the end.
     """
     try:
         operation = query_json.get("operation")
@@ -89,37 +164,40 @@ def execute_json_query(df: pd.DataFrame, query_json: dict, user_message: str):
             return real_col
         # --------------------------------------------------------
 
-        # 1. Start with the full DataFrame
-        filtered_df = df.copy()
-        
-        # 2. Apply All Filters (if any)
+        # 1. Combine All Filters (if any) into one selection of row positions
+        positions = None # None = every row
         query_filters = query_json.get('filters', [])
         if query_filters:
-            for f in query_filters:
-                filter_col_name = f.get('column')
-                filter_val = f.get('value')
-                
-                real_col_name = get_col(filter_col_name) # This can raise KeyError
-                
-                # Apply the filter (case-insensitive)
-                filtered_df = filtered_df[filtered_df[real_col_name].astype(str).str.lower() == str(filter_val).lower()]
-
-        # 3. Perform Aggregation
+            # This can raise KeyError
+            filters = [(get_col(f.get('column')), f.get('value')) for f in query_filters]
+            
+            if value_index is not None:
+                # Index lookups + intersections instead of comparing every row
+                positions = value_index.filter_positions(df, filters)
+            else:
+                # AND the (case-insensitive) boolean masks together
+                mask = np.ones(len(df), dtype=bool)
+                for real_col_name, filter_val in filters:
+                    mask &= column_equals(df[real_col_name], filter_val)
+                positions = np.flatnonzero(mask)
+
+        # 2. Perform Aggregation on just the columns it needs
         
         # --- OPERATION: SUM or MEAN ---
         if operation == 'sum' or operation == 'mean':
             agg_col_name = query_json.get('agg_col')
             agg_col = get_col(agg_col_name)
+            values = as_float64(select_rows(df[agg_col], positions))
             
             if operation == 'sum':
-                result = filtered_df[agg_col].sum()
+                result = values.sum()
             else:
-                result = filtered_df[agg_col].mean()
+                result = values.mean()
             return f"{result:,.2f}" # Return just the formatted number
 
         # --- OPERATION: COUNT ---
         elif operation == 'count':
-            result = filtered_df.shape[0]
+            result = len(df) if positions is None else len(positions)
             return f"{result}" # Return just the number
             
         # --- OPERATION: GROUPBY (e.g., which brand sold most) ---
@@ -131,7 +209,9 @@ def execute_json_query(df: pd.DataFrame, query_json: dict, user_message: str):
             groupby_col = get_col(groupby_col_name)
             agg_col = get_col(agg_col_name)
             
-            result_series = filtered_df.groupby(groupby_col)[agg_col].agg(agg_func)
+            group_keys = select_rows(df[groupby_col], positions)
+            values = as_float64(select_rows(df[agg_col], positions))
+            result_series = values.groupby(group_keys, observed=True).agg(agg_func)
             
             if agg_func == 'idxmax':
                 result = result_series.idxmax()
@@ -150,63 +230,260 @@ def execute_json_query(df: pd.DataFrame, query_json: dict, user_message: str):
         return f"I'm sorry, I ran into a Python error: {e}"
 # ----------------------------------------------------------------
 
-def get_ai_chat_response(retail_file: RetailFile, user_message: str):
+def get_query_columns(query_json: dict):
     """
-    Main function. Uses 3 AI calls: Classify, Generate JSON, Naturalize
+    Lists every column name a JSON query refers to (filters, agg_col, groupby_col).
     """
-    if not api_key:
-        return "Error: GOOGLE_AI_API_KEY not configured."
-    
-    # --- STEP 1: Classify the user's intent (Unchanged) ---
-    classification_prompt = f"""
-    You are an intent classifier. You must classify the user's message into one of two categories:
-    1.  **GREETING**: For hellos, goodbyes, thank-yous, or simple small talk.
-    2.  **DATA_QUERY**: For any question that requires looking at data.
-    User Message: "{user_message}"
-    Category:
+    columns = [f.get('column') for f in query_json.get('filters') or []]
+    columns += [query_json.get('agg_col'), query_json.get('groupby_col')]
+    return [col for col in columns if col]
+
+# --- RESULT CACHE FOR CHAT QUERIES ---
+# The same questions get asked all day ("total sales in Chennai"), so we
+# cache the raw data answer of every JSON query. The key is the dataset
+# version plus a canonical form of the query, so small differences in the
+# LLM's JSON (filter order, value case, column case) still hit the cache,
+# and a replaced file never serves an old answer.
+
+def canonicalize_query(retail_file: RetailFile, query_json: dict):
+    """
+    Returns a canonical JSON string for a query: real column names,
+    lower-cased filter values and sorted filters.
+    """
+    def resolve(col_name):
+        if not col_name:
+            return None
+        resolved = resolve_columns(retail_file, [col_name])
+        return resolved[0] if resolved else str(col_name).lower()
+
+    filters = sorted(
+        [resolve(f.get('column')) or '', normalize_value(f.get('value'))]
+        for f in query_json.get('filters') or []
+    )
+    canonical = {
+        "operation": query_json.get("operation"),
+        "agg_col": resolve(query_json.get("agg_col")),
+        "groupby_col": resolve(query_json.get("groupby_col")),
+        "agg_func": query_json.get("agg_func"),
+        "filters": filters,
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+def get_query_cache_key(retail_file: RetailFile, query_json: dict):
+    query_hash = hashlib.sha256(canonicalize_query(retail_file, query_json).encode()).hexdigest()
+    return f"retail-query:{retail_file.id}:{get_dataset_version(retail_file)}:{query_hash}"
+
+def run_cached_query(retail_file: RetailFile, query_json: dict, user_message: str):
     """
+    Returns (raw data answer, the path that served it) for a JSON query.
+    The path is 'cache' (same canonical query already answered for this file
+    version), 'cube' (pre-aggregated at ingest), 'index' (filters answered
+    from the value index) or 'frame' (a scan of the loaded columns).
+    """
+    cache_key = get_query_cache_key(retail_file, query_json)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        data_answer, served_by = cached
+        print(f"Query cache hit: {cache_key} (first served by {served_by})")
+        return data_answer, 'cache'
+
+    # The cube answers most filtered sum/mean/count questions without touching the rows
+    data_answer = execute_cube_query(load_retail_cube(retail_file), query_json)
+    served_by = 'cube'
+    if data_answer is None:
+        # Load only the columns this query touches from the sidecar
+        df = load_retail_dataframe(retail_file, columns=get_query_columns(query_json))
+        data_answer = execute_json_query(df, query_json, user_message, value_index=get_value_index(retail_file))
+        served_by = 'index' if query_json.get('filters') else 'frame'
+
+    # Errors are cheap to recompute, and may go away when the file is fixed
+    if "I'm sorry" not in data_answer:
+        query_cache.set(cache_key, (data_answer, served_by))
+    return data_answer, served_by
+# ----------------------------------------------------------------
+
+def get_greeting_response(user_message: str):
+    message = user_message.lower()
+    if message in ["hi", "hello"]:
+        return "Hello! I'm InsightBot. How can I help you with your sales data today?"
+    if "vanak" in message: # vanakkam, vanakam, ...
+        return "Vanakkam! Unga data pathi enna kelvi iruku?"
+    if "thank" in message or "nandri" in message or "nanri" in message:
+        return "You're welcome! Is there anything else I can help you with?"
+    return "Hello! I'm InsightBot, your data assistant. How can I help?"
+
+def get_schema_string(retail_file: RetailFile):
+    schema = retail_file.schema_json
+    return "\n".join([f"- {col} (type: {dtype})" for col, dtype in schema.items()])
+
+def get_chat_history_string(retail_file: RetailFile):
+    history = ChatMessage.objects.filter(retail_file=retail_file).order_by('timestamp')
+    return "\n".join(
+        [f"User: {msg.message}\nAI: {msg.response}" for msg in history]
+    )
+
+ANSWER_PLACEHOLDER = "{answer}"
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+def fill_answer_template(template, data_answer: str, user_message: str):
+    """
+    Puts the computed answer into the AI's reply template. The template may
+    not carry numbers of its own (other than ones the user typed), so any
+    number in the reply comes from execute_json_query. Returns None when
+    the template breaks that rule.
+    """
+    if not isinstance(template, str) or template.count(ANSWER_PLACEHOLDER) != 1:
+        return None
+    template_numbers = set(NUMBER_PATTERN.findall(template))
+    if not template_numbers <= set(NUMBER_PATTERN.findall(user_message)):
+        print(f"Reply template has numbers of its own, ignoring it: {template}")
+        return None
+    return template.replace(ANSWER_PLACEHOLDER, data_answer)
+
+def parse_single_call_response(response_text: str):
+    """
+    Parses the single-call answer. The query should be a JSON object, but a
+    query sent as a JSON string is accepted too.
+    """
+    response_json = parse_json_response(response_text)
+    query_json = response_json.get("query")
+    if isinstance(query_json, str) and query_json.strip():
+        query_json = json.loads(query_json)
+        response_json["query"] = query_json
+    if response_json.get("intent") == "DATA_QUERY" and not isinstance(query_json, dict):
+        raise ValueError("The AI's answer has no query object.")
+    return response_json
+
+def get_single_call_chat_response(retail_file: RetailFile, user_message: str, details: dict = None):
+    """
+    The single-round-trip chat mode (settings.CHAT_SINGLE_CALL): ONE AI call
+    returns the intent, the JSON query and a reply template, and Python fills
+    the computed answer into the template (no naturalizer call).
+    """
+    schema_string = get_schema_string(retail_file)
+    chat_history_str = get_chat_history_string(retail_file)
+
+    single_call_prompt = f"""
+    You are a data analyst chatbot. For the user's message, return ONE JSON object with these keys:
+    1.  "intent": "GREETING" or "DATA_QUERY".
+    2.  "reply": for a GREETING only, a short, friendly reply in the user's language.
+    3.  "query": for a DATA_QUERY only, the query as a JSON object (NOT a string), in one of the formats below.
+    4.  "answer_template": for a DATA_QUERY only, one natural sentence in the user's language,
+        with {ANSWER_PLACEHOLDER} where the answer goes.
+
+    Example (DATA_QUERY):
+    {{"intent": "DATA_QUERY", "query": {{"operation": "count", "filters": [{{"column": "Gender", "value": "Male"}}]}}, "answer_template": "There are {ANSWER_PLACEHOLDER} male customers."}}
+    Example (GREETING):
+    {{"intent": "GREETING", "reply": "Vanakkam! Unga sales data pathi enna therinjukanum?"}}
+
+    --- CRITICAL RULE ---
+    You do NOT know the answer; it is calculated later from the data.
+    NEVER write a number in the answer_template. Write {ANSWER_PLACEHOLDER} instead.
+    ---
+
+    --- DATAFRAME SCHEMA ---
+    {schema_string}
+    ---
+
+    {QUERY_JSON_FORMATS}
+
+    {QUERY_JSON_EXAMPLES}
+
+    Example reply templates:
+    User: "how many male customers are there?"
+    answer_template: "There are {ANSWER_PLACEHOLDER} male customers."
+    User: "chennai la sales evlo?"
+    answer_template: "Chennai-la total sales {ANSWER_PLACEHOLDER}."
+
+    Chat History (for context):
+    {chat_history_str}
+
+    User Message:
+    "{user_message}"
+
+    Now, generate ONLY the JSON object:
+    """
+
     try:
-        response = model.generate_content(classification_prompt)
-        intent = response.text.strip().upper()
+        response_json = generate_text(single_call_prompt, response_mime_type="application/json", parse=parse_single_call_response)
     except Exception as e:
-        print(f"Error during classification: {e}")
+        print(f"Error calling/parsing Gemini JSON: {e}")
         return f"Error connecting to AI: {e}"
 
-    print(f"User Message: '{user_message}' -> Intent Classified as: {intent}")
+    print(f"AI-generated single-call JSON: {response_json}")
+    if response_json.get("intent") != "DATA_QUERY":
+        return response_json.get("reply") or get_greeting_response(user_message)
+
+    query_json = response_json["query"] # A dict, checked by parse_single_call_response
+    if query_json.get("operation") == "clarify":
+        return query_json.get("message", "I'm not sure how to answer that. Can you rephrase?")
+
+    try:
+        data_answer, served_by = run_cached_query(retail_file, query_json, user_message)
+    except Exception as e:
+        return f"Error loading data file: {e}"
+    print(f"Data answer served by: {served_by}")
+    if details is not None:
+        details["served_by"] = served_by
+
+    if "I'm sorry" in data_answer:
+        return data_answer
+    return (fill_answer_template(response_json.get("answer_template"), data_answer, user_message)
+            or naturalize_with_template(user_message, query_json, data_answer))
+
+def get_ai_chat_response(retail_file: RetailFile, user_message: str, details: dict = None):
+    """
+    Main function. Uses up to 3 AI calls: Classify, Generate JSON, Naturalize
+    (Classify is skipped when the local classifier is confident, Naturalize
+    unless settings.CHAT_LLM_NATURALIZER is on, and settings.CHAT_SINGLE_CALL
+    does everything in one call.)
+    If 'details' (a dict) is given, a data answer adds "served_by" to it:
+    the path of run_cached_query that computed it.
+    """
+    if not is_configured():
+        return "Error: GOOGLE_AI_API_KEY not configured."
+    
+    # --- STEP 1: Classify the user's intent ---
+    # Clear greetings and data questions are classified locally, in microseconds
+    intent, confidence = classify_intent(user_message, retail_file.schema_json or {})
+    is_local = intent and confidence >= settings.CHAT_INTENT_MIN_CONFIDENCE
+    if is_local:
+        print(f"User Message: '{user_message}' -> Intent Classified locally as: {intent} ({confidence})")
+
+    if settings.CHAT_SINGLE_CALL and not (is_local and intent == GREETING):
+        # One AI call for the intent, the JSON query and the reply together
+        return get_single_call_chat_response(retail_file, user_message, details)
+
+    if not is_local:
+        # AI Call #1: only for the messages the local classifier isn't sure about
+        classification_prompt = f"""
+        You are an intent classifier. You must classify the user's message into one of two categories:
+        1.  **GREETING**: For hellos, goodbyes, thank-yous, or simple small talk.
+        2.  **DATA_QUERY**: For any question that requires looking at data.
+        User Message: "{user_message}"
+        Category:
+        """
+        try:
+            intent = generate_text(classification_prompt).strip().upper()
+        except Exception as e:
+            print(f"Error during classification: {e}")
+            return f"Error connecting to AI: {e}"
+
+        print(f"User Message: '{user_message}' -> Intent Classified as: {intent}")
 
     # --- STEP 2: Execute based on the intent ---
     
-    # ** IF IT'S A GREETING ** (Unchanged)
+    # ** IF IT'S A GREETING **
     if "GREETING" in intent or user_message.lower() in ["hi", "hello", "vanakkam", "thanks", "nandri"]:
         # (This part is working, so we keep it)
         print("Intent is GREETING. Returning a manual response.")
-        if user_message.lower() in ["hi", "hello"]:
-            return "Hello! I'm InsightBot. How can I help you with your sales data today?"
-        if user_message.lower() in ["vanakkam"]:
-            return "Vanakkam! Unga data pathi enna kelvi iruku?"
-        if user_message.lower() in ["thanks", "nandri"]:
-            return "You're welcome! Is there anything else I can help you with?"
-        return "Hello! I'm InsightBot, your data assistant. How can I help?"
+        return get_greeting_response(user_message)
 
     # ** IF IT'S A DATA_QUERY **
     elif "DATA_QUERY" in intent:
         print("Intent is DATA_QUERY. Proceeding to JSON generation.")
-        try:
-            file_path = retail_file.file.path
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-        except Exception as e:
-            return f"Error loading data file: {e}"
-            
-        schema = retail_file.schema_json
-        schema_string = "\n".join([f"- {col} (type: {dtype})" for col, dtype in schema.items()])
-        
-        history = ChatMessage.objects.filter(retail_file=retail_file).order_by('timestamp')
-        chat_history_str = "\n".join(
-            [f"User: {msg.message}\nAI: {msg.response}" for msg in history]
-        )
+        schema_string = get_schema_string(retail_file)
+        chat_history_str = get_chat_history_string(retail_file)
         
         # --- AI Call #2: Generate JSON Query (Prompt is unchanged) ---
         data_prompt = f"""
@@ -222,21 +499,7 @@ def get_ai_chat_response(retail_file: RetailFile, user_message: str):
         {schema_string}
         ---
         
-        --- AVAILABLE JSON FORMATS ---
-        1.  For SUM or MEAN (with optional filters):
-            {{"operation": "sum", "agg_col": "ACTUAL_COLUMN_NAME", "filters": [{{"column": "COL_NAME", "value": "FILTER_VAL"}}]}}
-            (agg_func can be "sum" or "mean")
-            
-        2.  For COUNT (with optional filters):
-            {{"operation": "count", "filters": [{{"column": "COL_NAME", "value": "FILTER_VAL"}}]}}
-            
-        3.  For GROUPBY & FIND MAX/MEAN (e.g., "which brand sold most?"):
-            {{"operation": "groupby_agg", "groupby_col": "GROUPBY_COLUMN", "agg_col": "AGGREGATE_COLUMN", "agg_func": "idxmax"}}
-            (agg_func can be "idxmax" for "which is best" or "mean" for "average by group")
-            
-        4.  If you cannot understand or find a column:
-            {{"operation": "clarify", "message": "I'm sorry, I couldn't find a column for [user's term]. Which column should I use?"}}
-        ---
+        {QUERY_JSON_FORMATS}
         
         Chat History (for context):
         {chat_history_str}
@@ -244,40 +507,13 @@ def get_ai_chat_response(retail_file: RetailFile, user_message: str):
         User Question:
         "{user_message}"
         
-        --- EXAMPLES (Based on schema in user's prompt) ---
-        
-        User: "Which brand generated the most revenue (Total Price)?"
-        AI: {{"operation": "groupby_agg", "groupby_col": "Brand", "agg_col": "Total Price", "agg_func": "idxmax"}}
-
-        User: "How many 'Negative' reviews did the 'Electronics' category receive?"
-        AI: {{"operation": "count", "filters": [{{"column": "ReviewSentiment", "value": "Negative"}}, {{"column": "Product Category", "value": "Electronics"}}]}}
-        
-        User: "What were the total sales for 'Clothing' in 'Chennai'?"
-        AI: {{"operation": "sum", "agg_col": "Total Price", "filters": [{{"column": "Product Category", "value": "Clothing"}}, {{"column": "CustomerCity", "value": "Chennai"}}]}}
-        
-        User: "Coimbatore-la, '18-25' age group la irukavanga ethana per UPI use pannirukanga?"
-        AI: {{"operation": "count", "filters": [{{"column": "CustomerCity", "value": "Coimbatore"}}, {{"column": "AgeGroup", "value": "18-25"}}, {{"column": "PaymentMethod", "value": "UPI"}}]}}
-        
-        User: "Which 'Product Category' has the highest average 'CustomerRating'?"
-        AI: {{"operation": "groupby_agg", "groupby_col": "Product Category", "agg_col": "CustomerRating", "agg_func": "idxmax"}}
-        
-        User: "What was the total profit?"
-        AI: {{"operation": "clarify", "message": "I'm sorry, I couldn't find a 'Profit' column in your file. Which column should I use to calculate profit?"}}
-        ---
+        {QUERY_JSON_EXAMPLES}
         
         Now, generate ONLY the JSON object for the user's question:
         """
         
         try:
-            response = model.generate_content(data_prompt)
-            json_response_text = response.text.strip()
-            
-            if json_response_text.startswith("```json"):
-                json_response_text = json_response_text[7:]
-            if json_response_text.endswith("```"):
-                json_response_text = json_response_text[:-3]
-            
-            query_json = json.loads(json_response_text)
+            query_json = generate_text(data_prompt, parse=parse_json_response)
             
         except Exception as e:
             print(f"Error calling/parsing Gemini JSON: {e}")
@@ -290,15 +526,22 @@ def get_ai_chat_response(retail_file: RetailFile, user_message: str):
             return query_json.get("message", "I'm not sure how to answer that. Can you rephrase?")
         
         # This function now returns the raw data (e.g., "148" or "Sony")
-        data_answer = execute_json_query(df, query_json, user_message)
+        try:
+            data_answer, served_by = run_cached_query(retail_file, query_json, user_message)
+        except Exception as e:
+            return f"Error loading data file: {e}"
+        print(f"Data answer served by: {served_by}")
+        if details is not None:
+            details["served_by"] = served_by
         
         # Check for errors from our code
         if "I'm sorry" in data_answer:
             return data_answer
 
-        # --- AI Call #3: Naturalize the response ---
-        final_answer = naturalize_response(user_message, data_answer)
-        return final_answer
+        # --- Naturalize the response (AI Call #3 only if enabled) ---
+        if settings.CHAT_LLM_NATURALIZER:
+            return naturalize_response(user_message, data_answer)
+        return naturalize_with_template(user_message, query_json, data_answer)
         
     else:
         # Fallback in case classification is unclear
@@ -1,23 +1,26 @@
-import google.generativeai as genai
 from django.conf import settings
+from .models import DashboardLayout, DashboardChartData
+from .retail_data import as_float64, get_dataset_version
 import pandas as pd
-import json
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Global AI Configuration ---
-api_key = settings.GOOGLE_AI_API_KEY
-if api_key:
-    genai.configure(api_key=api_key)
-# --- THIS IS THE FIX: Reverted to the Flash model ---
-model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
-# --- END OF FIX ---
+from .llm_client import generate_text, is_configured, parse_json_response
 # -----------------------------
 
-def get_dashboard_layout(schema: dict):
+def parse_layout(response_text: str):
+    layout_json = parse_json_response(response_text)
+    if not layout_json.get("charts"):
+        raise ValueError("The AI's dashboard plan has no charts.")
+    return layout_json
+
+def get_dashboard_layout(schema: dict, cache: bool = True):
     """
     AI Call #1: The "Planner"
     Asks the AI to generate a JSON "plan" for 4-6 charts.
+    cache=False always asks the AI (a regenerate must get a new plan).
     """
-    if not api_key:
+    if not is_configured():
         return {"error": "API key not configured."}
         
     schema_string = "\n".join([f"- {col} (type: {dtype})" for col, dtype in schema.items()])
@@ -61,27 +64,112 @@ def get_dashboard_layout(schema: dict):
     print("Calling Gemini Flash for dashboard layout...")
     try:
         # Removed the 'generation_config' as the prompt is now strict enough
-        response = model.generate_content(prompt)
-        json_response_text = response.text.strip()
-        
-        if json_response_text.startswith("```json"):
-            json_response_text = json_response_text[7:]
-        if json_response_text.endswith("```"):
-            json_response_text = json_response_text[:-3]
-        
-        layout_json = json.loads(json_response_text)
+        layout_json = generate_text(prompt, cache=cache, parse=parse_layout)
         return layout_json
         
     except Exception as e:
         print(f"Error calling/parsing Gemini JSON: {e}")
         return {"error": str(e)}
 
+def get_saved_dashboard_layout(retail_file, regenerate=False):
+    """
+    Returns (layout_json, DashboardLayout) for a file's schema, calling the
+    AI planner only when no layout is saved for that schema yet, or when
+    'regenerate' is asked for. On failure, returns ({"error": ...}, None).
+    """
+    schema_hash = retail_file.schema_hash
+    saved_layout = DashboardLayout.objects.filter(schema_hash=schema_hash).first()
+    if saved_layout and not regenerate:
+        print(f"Reusing dashboard layout v{saved_layout.version} for schema {schema_hash[:12]}")
+        return saved_layout.layout_json, saved_layout
+
+    dashboard_layout = get_dashboard_layout(retail_file.schema_json, cache=not regenerate)
+    if "error" in dashboard_layout or not dashboard_layout.get("charts"):
+        # Don't save a bad plan (a regenerate keeps the old one)
+        return dashboard_layout, None
+
+    if saved_layout:
+        saved_layout.layout_json = dashboard_layout
+        saved_layout.version += 1
+        saved_layout.save()
+        # Every file's charts were computed from the old plan
+        DashboardChartData.objects.filter(layout=saved_layout).delete()
+    else:
+        saved_layout, _ = DashboardLayout.objects.update_or_create(
+            schema_hash=schema_hash,
+            defaults={"layout_json": dashboard_layout},
+        )
+    return dashboard_layout, saved_layout
+
+
+def get_saved_chart_data(retail_file):
+    """
+    Returns the stored chart list for a file, or None if there is none, or
+    if it was computed from another layout version or another version of
+    the file (e.g. the file was replaced or the layout regenerated).
+    """
+    saved = DashboardChartData.objects.select_related('layout').filter(retail_file=retail_file).first()
+    if saved is None:
+        return None
+    if (saved.layout.schema_hash != retail_file.schema_hash
+            or saved.layout_version != saved.layout.version
+            or saved.dataset_version != get_dataset_version(retail_file)):
+        return None
+    return saved.chart_data
+
+
+def save_chart_data(retail_file, saved_layout, chart_data_list):
+    """
+    Stores the executed charts, so the next page load is one DB read.
+    """
+    if any(chart["chart_type"] == "error" for chart in chart_data_list):
+        return # A failed chart may work next time, don't pin it
+    DashboardChartData.objects.update_or_create(
+        retail_file=retail_file,
+        defaults={
+            "layout": saved_layout,
+            "layout_version": saved_layout.version,
+            "dataset_version": get_dataset_version(retail_file),
+            "chart_data": chart_data_list,
+        },
+    )
+
+
+MONTH_ORDER = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+def aggregate_group(df: pd.DataFrame, x_col, aggregations):
+    """
+    Computes every (y_col, agg_func) of the charts that share x_col in ONE
+    groupby pass. Returns {(y_col, agg_func): Series or the Exception it raised}.
+    """
+    y_cols = list(dict.fromkeys(y_col for y_col, _ in aggregations))
+    funcs = {y_col: list(dict.fromkeys(f for y, f in aggregations if y == y_col)) for y_col in y_cols}
+    values = as_float64(df[y_cols])
+    try:
+        fused = values.groupby(df[x_col], observed=True).agg(funcs)
+        return {(y_col, agg_func): fused[(y_col, agg_func)] for y_col, agg_func in aggregations}
+    except Exception as e:
+        # One bad chart (e.g. 'sum' of a text column) fails the whole pass,
+        # so work them out one by one to keep the good charts
+        print(f"Fused groupby on '{x_col}' failed ({e}), running its charts one by one")
+
+    results = {}
+    for y_col, agg_func in aggregations:
+        try:
+            results[(y_col, agg_func)] = values[y_col].groupby(df[x_col], observed=True).agg(agg_func)
+        except Exception as e:
+            results[(y_col, agg_func)] = e
+    return results
+
+
 def execute_dashboard_queries(df: pd.DataFrame, chart_list: list):
     """
     The "Executor"
-    (This function is unchanged, it's already correct)
+    Plans first: charts that share an x_col are computed together in one
+    groupby pass, and the different x_cols run in a thread pool. The output
+    list is in the same order and format as the chart plan.
     """
-    chart_data_list = []
     available_columns = {col.lower(): col for col in df.columns} # {lower: RealCase}
 
     def get_col(col_name):
@@ -91,31 +179,67 @@ def execute_dashboard_queries(df: pd.DataFrame, chart_list: list):
             raise KeyError(f"AI planned to use column '{col_name}', but it wasn't found in the file.")
         return real_col
 
+    def failed_chart(title, e):
+        return {
+            "title": f"{title} (Failed)",
+            "chart_type": "error",
+            "error_message": str(e),
+        }
+
+    # --- Plan: resolve every chart and group them by x_col ---
+    planned = [] # [(title, chart_type, x_col, y_col, agg_func) or a failed chart]
+    groups = {} # {x_col: [(y_col, agg_func)]}
     for chart_plan in chart_list:
+        title = chart_plan.get("title", "Untitled Chart")
+        chart_type = chart_plan.get("chart_type", "bar")
         try:
-            title = chart_plan.get("title", "Untitled Chart")
-            chart_type = chart_plan.get("chart_type", "bar")
             x_col = get_col(chart_plan.get("x_col"))
             y_col = get_col(chart_plan.get("y_col"))
-            agg_func = chart_plan.get("agg_func", "sum")
-            
-            # --- Perform the Pandas Query ---
+        except KeyError as e:
+            print(f"Skipping chart '{title}' due to error: {e}")
+            planned.append(failed_chart(title, e))
+            continue
+        if chart_type not in ("line", "bar", "pie"):
+            continue
+        agg_func = chart_plan.get("agg_func", "sum")
+        planned.append((title, chart_type, x_col, y_col, agg_func))
+        aggregations = groups.setdefault(x_col, [])
+        if (y_col, agg_func) not in aggregations:
+            aggregations.append((y_col, agg_func))
+
+    # --- Execute: one groupby pass per x_col, independent x_cols in parallel ---
+    results = {} # {x_col: {(y_col, agg_func): Series or Exception}}
+    workers = min(settings.RETAIL_DASHBOARD_WORKERS, len(groups))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {x_col: pool.submit(aggregate_group, df, x_col, aggregations) for x_col, aggregations in groups.items()}
+            results = {x_col: future.result() for x_col, future in futures.items()}
+    else:
+        results = {x_col: aggregate_group(df, x_col, aggregations) for x_col, aggregations in groups.items()}
+
+    # --- Shape each chart and format it for Chart.js ---
+    chart_data_list = []
+    for chart in planned:
+        if isinstance(chart, dict):
+            chart_data_list.append(chart)
+            continue
+        title, chart_type, x_col, y_col, agg_func = chart
+        try:
+            chart_data = results[x_col][(y_col, agg_func)]
+            if isinstance(chart_data, Exception):
+                raise chart_data
+
             if chart_type == "line":
-                chart_data = df.groupby(x_col)[y_col].agg(agg_func)
                 try:
-                    month_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-                    chart_data = chart_data.reindex(month_order, fill_value=0)
+                    chart_data = chart_data.reindex(MONTH_ORDER, fill_value=0)
                 except Exception as e:
                     print(f"Could not sort by month, using default sort: {e}")
                     chart_data = chart_data.sort_index()
             elif chart_type == "bar":
-                chart_data = df.groupby(x_col)[y_col].agg(agg_func).nlargest(10).sort_values(ascending=False)
+                chart_data = chart_data.nlargest(10).sort_values(ascending=False)
             elif chart_type == "pie":
-                chart_data = df.groupby(x_col)[y_col].agg(agg_func).nlargest(5)
-            else:
-                continue
+                chart_data = chart_data.nlargest(5)
             
-            # --- Format for Chart.js ---
             chart_data_list.append({
                 "title": title,
                 "chart_type": chart_type,
@@ -126,17 +250,9 @@ def execute_dashboard_queries(df: pd.DataFrame, chart_list: list):
             
         except KeyError as e:
             print(f"Skipping chart '{title}' due to error: {e}")
-            chart_data_list.append({
-                "title": f"{title} (Failed)",
-                "chart_type": "error",
-                "error_message": str(e),
-            })
+            chart_data_list.append(failed_chart(title, e))
         except Exception as e:
             print(f"Skipping chart '{title}' due to unexpected error: {e}")
-            chart_data_list.append({
-                "title": f"{title} (Failed)",
-                "chart_type": "error",
-                "error_message": str(e),
-            })
+            chart_data_list.append(failed_chart(title, e))
             
-    return chart_data_list
\ No newline at end of file
+    return chart_data_list
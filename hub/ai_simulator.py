@@ -1,27 +1,33 @@
-import google.generativeai as genai
 from django.conf import settings
 import pandas as pd
-import json
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from statsmodels.tools.sm_exceptions import ConvergenceWarning
-import warnings
-
-# Suppress warnings from the SARIMA model for a cleaner output
-warnings.simplefilter('ignore', ConvergenceWarning)
+import re
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from .models import SalesForecast, ForecastOrder, ForecastColumns
+from .retail_data import DATE_VALUE_PATTERN, as_float64, get_dataset_version, load_retail_dataframe, read_sample
+from .retail_forecast import (
+    MIN_MONTHS, FAST_MIN_MONTHS, ORDER_CANDIDATES, cross_validate_order,
+    fit_sarima_forecast, fit_holt_winters_forecast, forecast_segment, get_model_order,
+    run_with_deadline, simulate_scenarios,
+)
+import calendar
+import time
 
 # --- Global AI Configuration ---
-api_key = settings.GOOGLE_AI_API_KEY
-if api_key:
-    genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.5-flash-preview-09-2025')
+from .llm_client import generate_text, is_configured, parse_json_response
 # -----------------------------
 
+# The SARIMA model the forecast page fits
+SARIMA_ORDER = (1, 1, 1)
+SARIMA_SEASONAL_ORDER = (1, 1, 0, 12)
+
 # --- THIS IS THE NEW "AI SUMMARY" FUNCTION ---
 def generate_forecast_summary(historical_data, forecast_data, sales_col_name):
     """
     AI Call #2: Asks the AI to write a human-like summary of the forecast.
     """
-    if not api_key:
+    if not is_configured():
         return "Forecast complete." # Failsafe
     
     # Prepare data for the prompt
@@ -63,8 +69,7 @@ def generate_forecast_summary(historical_data, forecast_data, sales_col_name):
     
     print("Calling Gemini to generate forecast summary...")
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return generate_text(prompt).strip()
     except Exception as e:
         print(f"Error during summary generation: {e}")
         # Failsafe: return a simple, robotic summary
@@ -73,12 +78,19 @@ def generate_forecast_summary(historical_data, forecast_data, sales_col_name):
 # --- END OF NEW FUNCTION ---
 
 
+def parse_forecast_columns(response_text: str):
+    columns = parse_json_response(response_text)
+    if not columns.get("month_col") or not columns.get("sales_col"):
+        raise ValueError("The AI didn't name a month and a sales column.")
+    return columns
+
+
 def get_forecast_columns(schema: dict):
     """
     AI Call #1: Asks the AI to identify the correct Date and Sales columns.
     (This function is unchanged)
     """
-    if not api_key:
+    if not is_configured():
         return {"error": "API key not configured."}
         
     schema_string = "\n".join([f"- {col} (type: {dtype})" for col, dtype in schema.items()])
@@ -119,79 +131,256 @@ def get_forecast_columns(schema: dict):
     
     print("Calling Gemini to identify forecast columns...")
     try:
-        response = model.generate_content(prompt)
-        json_response_text = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(json_response_text)
+        return generate_text(prompt, parse=parse_forecast_columns)
     except Exception as e:
         print(f"Error calling/parsing Gemini JSON: {e}")
         return {"error": str(e)}
 
-def run_sales_forecast(df: pd.DataFrame, sales_col: str, month_col: str, year_col: str = None):
+# --- LOCAL FORECAST-COLUMN DETECTOR ---
+# Finds the month/year (or date) and sales columns from the column names,
+# dtypes and a sample of the values, so most forecasts need no AI call.
+# Each column gets a score in [0, 1]; get_forecast_columns (the AI) is only
+# asked when the weakest of the picked columns scores below
+# settings.RETAIL_FORECAST_COLUMNS_MIN_CONFIDENCE.
+
+MONTH_NAMES = {name.lower() for name in calendar.month_name if name}
+SALES_NAME_HINTS = {
+    'sales': 1.0, 'revenue': 1.0, 'total': 1.0, 'amount': 1.0, 'turnover': 1.0, 'gmv': 1.0,
+    'price': 0.6, 'value': 0.6, 'net': 0.6, 'gross': 0.6, 'profit': 0.4,
+}
+NOT_SALES_NAME_HINTS = ('id', 'code', 'zip', 'pin', 'phone', 'year', 'month', 'day', 'rating', 'age', 'qty', 'quantity', 'count')
+DETECTOR_SAMPLE_ROWS = 2000
+
+
+def _name_words(col_name):
+    return re.findall(r'[a-z]+', re.sub(r'([a-z])([A-Z])', r'\1 \2', str(col_name)).lower())
+
+
+def _score_month(col_name, values: pd.Series):
+    # run_sales_forecast parses '<year>-<month name>', so only full month names count
+    if pd.api.types.is_numeric_dtype(values.dtype) or values.empty:
+        return 0.0
+    if values.astype(str).str.strip().str.lower().isin(MONTH_NAMES).mean() < 0.9:
+        return 0.0
+    name_score = 1.0 if 'month' in _name_words(col_name) else 0.0
+    return 0.7 + 0.3 * name_score
+
+
+def _score_year(col_name, values: pd.Series):
+    numbers = pd.to_numeric(values.astype(str), errors='coerce')
+    if numbers.isna().mean() > 0.05 or values.empty:
+        return 0.0
+    in_range = numbers.between(1900, 2100).mean() >= 0.95 and (numbers % 1 == 0).all()
+    if not in_range:
+        return 0.0
+    name_score = 1.0 if {'year', 'yr'} & set(_name_words(col_name)) else 0.0
+    return 0.7 + 0.3 * name_score
+
+
+def _score_date(col_name, values: pd.Series):
+    name_score = 1.0 if {'date', 'time', 'period', 'timestamp'} & set(_name_words(col_name)) else 0.0
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return 0.7 + 0.3 * name_score
+    if pd.api.types.is_numeric_dtype(values.dtype) or values.empty:
+        return 0.0
+    text = values.astype(str)
+    if text.str.match(DATE_VALUE_PATTERN).mean() < 0.9:
+        return 0.0
+    if pd.to_datetime(text, errors='coerce').notna().mean() < 0.9:
+        return 0.0
+    return 0.6 + 0.3 * name_score
+
+
+def _score_sales(col_name, values: pd.Series):
+    if not pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype) or values.empty:
+        return 0.0
+    words = _name_words(col_name)
+    if any(hint in words for hint in NOT_SALES_NAME_HINTS):
+        return 0.0
+    name_score = max([SALES_NAME_HINTS.get(word, 0.0) for word in words] + [0.0])
+    # Money is mostly positive, and usually has cents
+    value_score = 0.5 * float((values >= 0).mean() >= 0.95)
+    value_score += 0.5 * float((values % 1 != 0).mean() > 0.1)
+    return 0.6 * name_score + 0.4 * value_score
+
+
+def detect_forecast_columns(df: pd.DataFrame):
+    """
+    The local detector. Returns the same keys as get_forecast_columns, plus
+    "confidence" (the weakest picked column's score, 0 if one is missing).
+    """
+    sample = df.sample(n=DETECTOR_SAMPLE_ROWS, random_state=0) if len(df) > DETECTOR_SAMPLE_ROWS else df
+    scores = {} # {kind: [(score, column)]}
+    for col in sample.columns:
+        values = sample[col].dropna()
+        for kind, score_column in (('month', _score_month), ('year', _score_year),
+                                   ('date', _score_date), ('sales', _score_sales)):
+            score = score_column(col, values)
+            if score > 0:
+                scores.setdefault(kind, []).append((score, col))
+
+    def best(kind):
+        ranked = sorted(scores.get(kind, []), key=lambda item: -item[0])
+        if not ranked:
+            return 0.0, None
+        score, col = ranked[0]
+        # Two equally good candidates: we can't really tell which one it is
+        if len(ranked) > 1 and ranked[1][0] >= score - 0.05:
+            score *= 0.8
+        return score, col
+
+    month_score, month_col = best('month')
+    year_score, year_col = best('year')
+    date_score, date_col = best('date')
+    sales_score, sales_col = best('sales')
+
+    # Separate month + year columns, or one date column
+    if month_col and year_col and min(month_score, year_score) >= date_score:
+        columns = {"month_col": month_col, "year_col": year_col, "sales_col": sales_col}
+        time_score = min(month_score, year_score)
+    else:
+        columns = {"month_col": date_col, "year_col": None, "sales_col": sales_col}
+        time_score = date_score
+    columns["confidence"] = round(min(time_score, sales_score), 3)
+    return columns
+
+
+def find_forecast_columns(retail_file):
+    """
+    Returns {"month_col", "year_col", "sales_col"} for a file (or {"error"}).
+    Saved per schema hash; otherwise detected locally, and only the AI is
+    asked (get_forecast_columns) when the local detector isn't confident.
+    """
+    schema_hash = retail_file.schema_hash
+    saved = ForecastColumns.objects.filter(schema_hash=schema_hash).first()
+    if saved:
+        return saved.columns_json
+
+    detected = {"confidence": 0.0}
+    try:
+        # A sample is enough to tell the columns apart; the file isn't loaded
+        detected = detect_forecast_columns(read_sample(retail_file, DETECTOR_SAMPLE_ROWS))
+    except Exception as e:
+        print(f"Forecast column detector failed: {e}")
+    confidence = detected.pop("confidence")
+    print(f"Detected forecast columns {detected} (confidence {confidence})")
+
+    source = 'detector'
+    column_names = detected
+    if confidence < settings.RETAIL_FORECAST_COLUMNS_MIN_CONFIDENCE:
+        column_names = get_forecast_columns(retail_file.schema_json)
+        source = 'ai'
+        if "error" in column_names:
+            if detected.get("month_col") and detected.get("sales_col"):
+                print(f"AI Column-Finder failed ({column_names['error']}), using the detector's guess")
+                return detected # Not saved, so the AI is asked again next time
+            return column_names
+
+    ForecastColumns.objects.update_or_create(
+        schema_hash=schema_hash,
+        defaults={"columns_json": column_names, "source": source, "confidence": confidence},
+    )
+    return column_names
+
+
+def prepare_forecast_frame(df: pd.DataFrame, sales_col: str, month_col: str, year_col: str = None):
+    """
+    Builds the '__temp_date' index from the month (and year) columns and
+    drops rows without a date or a sales value.
+    """
+    if year_col:
+        df['__temp_date_str'] = df[year_col].astype(str) + '-' + df[month_col].astype(str)
+        df['__temp_date'] = pd.to_datetime(df['__temp_date_str'], format='%Y-%B')
+    else:
+        df['__temp_date'] = pd.to_datetime(df[month_col], errors='coerce')
+
+    df = df.dropna(subset=['__temp_date', sales_col])
+    df[sales_col] = as_float64(df[sales_col])
+    return df.set_index('__temp_date')
+
+
+def select_forecast_model(monthly_sales: pd.Series, order=SARIMA_ORDER, seasonal_order=SARIMA_SEASONAL_ORDER,
+                          saved_params: dict = None, budget_seconds: float = None):
+    """
+    Picks SARIMA or the fast Holt-Winters model, and never takes (much)
+    longer than the budget (default settings.RETAIL_FORECAST_BUDGET_SECONDS):
+    - under 24 months (SARIMA can't fit) or very long series: the fast model
+    - otherwise SARIMA, if it finishes in the time left; if not, the fast model
+    The reason is saved in the result's model["selected_because"].
+    """
+    budget_seconds = budget_seconds or settings.RETAIL_FORECAST_BUDGET_SECONDS
+    start = time.perf_counter()
+    
+    # Always ready in milliseconds, so there is something to return in time
+    fast_forecast = fit_holt_winters_forecast(monthly_sales)
+    if len(monthly_sales) < MIN_MONTHS:
+        fast_forecast["model"]["selected_because"] = f"less than {MIN_MONTHS} months of data"
+        return fast_forecast
+    if len(monthly_sales) > settings.RETAIL_FORECAST_SARIMA_MAX_MONTHS:
+        fast_forecast["model"]["selected_because"] = f"more than {settings.RETAIL_FORECAST_SARIMA_MAX_MONTHS} months of data"
+        return fast_forecast
+
+    # In a child process, so a fit that runs over the budget is killed
+    # instead of slowing down the jobs after it
+    try:
+        forecast_data = run_with_deadline(
+            fit_sarima_forecast, (monthly_sales, order, seasonal_order, saved_params),
+            timeout=max(budget_seconds - (time.perf_counter() - start), 0),
+        )
+        forecast_data["model"]["selected_because"] = "SARIMA finished within the time budget"
+        return forecast_data
+    except TimeoutError:
+        print(f"SARIMA didn't finish within {budget_seconds}s, using the fast model")
+        fast_forecast["model"]["selected_because"] = "SARIMA did not finish within the time budget"
+        fast_forecast["model"]["over_budget"] = True
+    except Exception as e:
+        print(f"SARIMA failed ({e}), using the fast model")
+        fast_forecast["model"]["selected_because"] = f"SARIMA failed: {e}"
+    return fast_forecast
+
+
+def run_sales_forecast(df: pd.DataFrame, sales_col: str, month_col: str, year_col: str = None,
+                       order=SARIMA_ORDER, seasonal_order=SARIMA_SEASONAL_ORDER, saved_params: dict = None,
+                       budget_seconds: float = None):
     """
     The main Data Science function.
     It now calls the new AI summary function at the end.
+    The model is SARIMA, or the fast Holt-Winters model for short series or
+    when SARIMA would take longer than the time budget (see select_forecast_model).
+    The result also has a "model" entry with the model, the fitted
+    parameters, the fit time and the optimiser's iterations, so it can be
+    saved (see run_saved_sales_forecast). 'saved_params' warm-start SARIMA.
     """
     try:
         # --- 1. Data Pre-processing (Unchanged) ---
         print(f"Running forecast on sales_col='{sales_col}', month_col='{month_col}', year_col='{year_col}'")
         
-        if year_col:
-            df['__temp_date_str'] = df[year_col].astype(str) + '-' + df[month_col].astype(str)
-            df['__temp_date'] = pd.to_datetime(df['__temp_date_str'], format='%Y-%B')
-        else:
-            df['__temp_date'] = pd.to_datetime(df[month_col], errors='coerce')
-
-        df = df.dropna(subset=['__temp_date', sales_col])
+        df = prepare_forecast_frame(df, sales_col, month_col, year_col)
         
         if df.empty:
             return {"error": "The data was empty after cleaning. Check the date and sales columns."}
 
-        df = df.set_index('__temp_date')
         monthly_sales = df[sales_col].resample('M').sum()
         
-        if len(monthly_sales) < 24:
-            return {"error": f"Not enough data for a reliable forecast. Need at least 24 months of data, but found only {len(monthly_sales)}."}
-
-        # --- 2. Train the SARIMA Model (Unchanged) ---
-        print("Training SARIMA model...")
-        model = SARIMAX(monthly_sales,
-                        order=(1, 1, 1),
-                        seasonal_order=(1, 1, 0, 12),
-                        enforce_stationarity=False,
-                        enforce_invertibility=False)
-        
-        results = model.fit(disp=False)
+        if len(monthly_sales) < FAST_MIN_MONTHS:
+            return {"error": f"Not enough data for a forecast. Need at least {FAST_MIN_MONTHS} months of data, but found only {len(monthly_sales)}."}
 
-        # --- 3. Generate Forecast (Unchanged) ---
-        print("Generating 12-month forecast...")
-        forecast = results.get_forecast(steps=12)
-        predicted_mean = forecast.predicted_mean
-        confidence_intervals = forecast.conf_int(alpha=0.05)
-        
-        # --- 4. Format Data for Chart.js (Dates/Values) ---
-        historical_labels = list(monthly_sales.index.strftime('%Y-%m'))
-        historical_values = [float(v) for v in monthly_sales.values]
-        
-        forecast_labels = list(predicted_mean.index.strftime('%Y-%m'))
-        forecast_values = [float(v) for v in predicted_mean.values]
-        
-        lower_ci = [float(v) for v in confidence_intervals.iloc[:, 0]]
-        upper_ci = [float(v) for v in confidence_intervals.iloc[:, 1]]
+        # --- 2. Train the model (within the time budget) and generate the 12-month forecast ---
+        print("Training forecast model...")
+        forecast_data = select_forecast_model(monthly_sales, order, seasonal_order, saved_params, budget_seconds)
+        fit_info = forecast_data["model"]
+        print(f"{fit_info['name']} fit took {fit_info['fit_seconds']}s, {fit_info['iterations']} iterations "
+              f"({'warm' if fit_info['warm_start'] else 'cold'} start, chosen because {fit_info['selected_because']})")
 
-        # --- 5. THIS IS THE NEW PART ---
+        # --- 3. THIS IS THE NEW PART ---
         # Instead of writing a robotic summary, we call our new AI function
         print("Generating AI summary...")
-        summary = generate_forecast_summary(historical_values, forecast_values, sales_col)
+        summary = generate_forecast_summary(forecast_data["historical_values"], forecast_data["forecast_values"], sales_col)
         # --- END OF NEW PART ---
 
         return {
             "summary": summary, # This is now the new AI-generated summary
-            "historical_labels": historical_labels,
-            "historical_values": historical_values,
-            "forecast_labels": forecast_labels,
-            "forecast_values": forecast_values,
-            "lower_ci": lower_ci,
-            "upper_ci": upper_ci,
+            **forecast_data,
         }
 
     except KeyError as e:
@@ -199,4 +388,235 @@ def run_sales_forecast(df: pd.DataFrame, sales_col: str, month_col: str, year_co
         return {"error": f"The AI picked a column that doesn't exist: {e}. Please check your file."}
     except Exception as e:
         print(f"Forecast failed with unexpected error: {e}")
-        return {"error": f"An error occurred during forecasting: {e}"}
\ No newline at end of file
+        return {"error": f"An error occurred during forecasting: {e}"}
+
+
+def run_segmented_forecast(df: pd.DataFrame, sales_col: str, month_col: str, year_col: str = None,
+                           segment_col: str = None, order=SARIMA_ORDER, seasonal_order=SARIMA_SEASONAL_ORDER,
+                           workers: int = None):
+    """
+    Forecasts every value of 'segment_col' (e.g. each City or Product
+    Category) separately. The SARIMA fits run in parallel on a process pool
+    of 'workers' processes (default settings.RETAIL_FORECAST_WORKERS).
+    Segments don't get an AI summary; each one reports its fit time, and
+    failed segments report their error instead of a forecast.
+    """
+    start = time.perf_counter()
+    try:
+        print(f"Running segmented forecast on sales_col='{sales_col}' by segment_col='{segment_col}'")
+        df = prepare_forecast_frame(df, sales_col, month_col, year_col)
+        if df.empty:
+            return {"error": "The data was empty after cleaning. Check the date and sales columns."}
+
+        # One monthly series per segment, exactly like the grand total's
+        segment_sales = [
+            (str(segment), segment_df[sales_col].resample('M').sum())
+            for segment, segment_df in df.groupby(segment_col, observed=True)
+        ]
+    except KeyError as e:
+        print(f"Segmented forecast failed with KeyError: {e}")
+        return {"error": f"The AI picked a column that doesn't exist: {e}. Please check your file."}
+
+    workers = min(workers or settings.RETAIL_FORECAST_WORKERS, len(segment_sales)) or 1
+    print(f"Fitting {len(segment_sales)} segments on {workers} worker(s)...")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (segment, pool.submit(forecast_segment, segment, monthly_sales, order, seasonal_order))
+                for segment, monthly_sales in segment_sales
+            ]
+            segments = []
+            for segment, future in futures:
+                try:
+                    segments.append(future.result())
+                except Exception as e: # e.g. the worker process died
+                    segments.append({"segment": segment, "error": f"Worker failed: {e}", "seconds": None})
+    else:
+        segments = [
+            forecast_segment(segment, monthly_sales, order, seasonal_order)
+            for segment, monthly_sales in segment_sales
+        ]
+
+    return {
+        "segment_col": segment_col,
+        "segments": segments,
+        "failed": [result["segment"] for result in segments if "error" in result],
+        "workers": workers,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def get_saved_sales_forecast(retail_file):
+    """
+    The forecast the forecast job would return for the current version of
+    the file, if it is already saved; None if the job has to run. Only
+    database lookups: no data is loaded and the AI is not called.
+    """
+    saved_columns = ForecastColumns.objects.filter(schema_hash=retail_file.schema_hash).first()
+    if saved_columns is None:
+        return None
+    column_names = saved_columns.columns_json
+    columns = {
+        "sales_col": column_names.get('sales_col'),
+        "month_col": column_names.get('month_col'),
+        "year_col": column_names.get('year_col') or '',
+    }
+
+    order, seasonal_order = SARIMA_ORDER, SARIMA_SEASONAL_ORDER
+    if settings.RETAIL_FORECAST_AUTO_ORDER:
+        saved_order = ForecastOrder.objects.filter(retail_file=retail_file, **columns).first()
+        if saved_order is None:
+            return None
+        order, seasonal_order = tuple(saved_order.order), tuple(saved_order.seasonal_order)
+
+    saved = SalesForecast.objects.filter(
+        retail_file=retail_file,
+        model_order=get_model_order(order, seasonal_order),
+        dataset_version=get_dataset_version(retail_file),
+        **columns,
+    ).first()
+    return saved.forecast_json if saved else None
+
+
+def run_saved_sales_forecast(retail_file, sales_col: str, month_col: str, year_col: str = None,
+                             order=SARIMA_ORDER, seasonal_order=SARIMA_SEASONAL_ORDER):
+    """
+    Returns the saved forecast for this file, column choice and model order,
+    and only loads the data and refits when there is none yet, or when the
+    file has changed since it was fitted (then warm-started from the saved
+    parameters).
+    """
+    model_order = get_model_order(order, seasonal_order)
+    dataset_version = get_dataset_version(retail_file)
+    saved = SalesForecast.objects.filter(
+        retail_file=retail_file,
+        sales_col=sales_col,
+        month_col=month_col,
+        year_col=year_col or '',
+        model_order=model_order,
+    ).first()
+    if saved and saved.dataset_version == dataset_version:
+        print(f"Reusing saved forecast {model_order} for RetailFile {retail_file.id}")
+        return saved.forecast_json
+
+    # Only load the 2-3 columns the forecast needs
+    df = load_retail_dataframe(retail_file, columns=[sales_col, month_col, year_col])
+    # The file changed (e.g. a new month was added): start from the old fit
+    # (if the saved fit was the fast model, its params don't match and are ignored)
+    saved_params = saved.params_json if saved else None
+    forecast_data = run_sales_forecast(df, sales_col, month_col, year_col, order, seasonal_order, saved_params)
+    if "error" in forecast_data:
+        return forecast_data # Not saved, so a fixed file is retried
+    if forecast_data["model"].get("over_budget"):
+        return forecast_data # Not saved, so SARIMA gets another chance next time
+
+    SalesForecast.objects.update_or_create(
+        retail_file=retail_file,
+        sales_col=sales_col,
+        month_col=month_col,
+        year_col=year_col or '',
+        model_order=model_order,
+        defaults={
+            "dataset_version": dataset_version,
+            "forecast_json": forecast_data,
+            "params_json": forecast_data["model"]["params"],
+        },
+    )
+    return forecast_data
+
+
+def search_sarima_order(monthly_sales: pd.Series, budget_seconds: float = None, workers: int = None):
+    """
+    Auto-tuning: scores every ORDER_CANDIDATES order by rolling-origin
+    cross-validation, fitting the candidates in parallel on a process pool.
+    Stops when the budget (default settings.RETAIL_FORECAST_SEARCH_BUDGET_SECONDS)
+    runs out and keeps the best order scored so far.
+    """
+    budget_seconds = budget_seconds or settings.RETAIL_FORECAST_SEARCH_BUDGET_SECONDS
+    workers = workers or settings.RETAIL_FORECAST_WORKERS
+    start = time.perf_counter()
+    
+    # The current default goes first, so there is always a baseline to beat
+    default = (SARIMA_ORDER, SARIMA_SEASONAL_ORDER)
+    candidates = sorted(ORDER_CANDIDATES, key=lambda candidate: candidate != default)
+    print(f"Searching {len(candidates)} SARIMA orders on {workers} worker(s), budget {budget_seconds}s...")
+
+    results = []
+    finished = queue.Queue()
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        for order, seasonal_order in candidates:
+            pool.apply_async(
+                cross_validate_order, (monthly_sales, order, seasonal_order),
+                callback=finished.put,
+                error_callback=lambda e: finished.put({"error": f"Worker failed: {e}"}),
+            )
+        while len(results) < len(candidates):
+            remaining = budget_seconds - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+            try:
+                results.append(finished.get(timeout=remaining))
+            except queue.Empty:
+                break
+    finally:
+        # Kill the candidates still running, so they don't take CPU from
+        # the (budgeted) fit that comes after the search
+        pool.terminate()
+        pool.join()
+
+    scored = [result for result in results if "cv_error" in result]
+    search = {
+        "tried": len(results),
+        "not_tried": len(candidates) - len(results),
+        "seconds": round(time.perf_counter() - start, 3),
+        "candidates": sorted(results, key=lambda result: result.get("cv_error", float('inf'))),
+    }
+    if not scored:
+        if results:
+            search["error"] = f"No candidate order could be cross-validated: {results[0].get('error')}"
+        else:
+            search["error"] = "No candidate order could be cross-validated in time."
+        return search
+
+    best = min(scored, key=lambda result: result["cv_error"])
+    print(f"Best SARIMA order {best['order']}x{best['seasonal_order']} (CV error {best['cv_error']:,.2f}), "
+          f"{len(results)}/{len(candidates)} tried in {search['seconds']}s")
+    return {"order": tuple(best["order"]), "seasonal_order": tuple(best["seasonal_order"]),
+            "cv_error": best["cv_error"], **search}
+
+
+def get_tuned_order(retail_file, sales_col: str, month_col: str, year_col: str = None):
+    """
+    Returns (order, seasonal_order) for this file and column choice: the
+    saved winner of an earlier search, or the result of a new search (then
+    saved, so later runs skip it). Falls back to the default order.
+    """
+    saved = ForecastOrder.objects.filter(
+        retail_file=retail_file, sales_col=sales_col, month_col=month_col, year_col=year_col or '',
+    ).first()
+    if saved:
+        return tuple(saved.order), tuple(saved.seasonal_order)
+
+    try:
+        df = load_retail_dataframe(retail_file, columns=[sales_col, month_col, year_col])
+        monthly_sales = prepare_forecast_frame(df, sales_col, month_col, year_col)[sales_col].resample('M').sum()
+    except Exception as e:
+        print(f"Order search skipped: {e}")
+        return SARIMA_ORDER, SARIMA_SEASONAL_ORDER
+
+    search = search_sarima_order(monthly_sales)
+    if "error" in search:
+        print(f"Order search failed: {search['error']}")
+        return SARIMA_ORDER, SARIMA_SEASONAL_ORDER
+
+    ForecastOrder.objects.update_or_create(
+        retail_file=retail_file, sales_col=sales_col, month_col=month_col, year_col=year_col or '',
+        defaults={
+            "order": list(search["order"]),
+            "seasonal_order": list(search["seasonal_order"]),
+            "cv_error": search["cv_error"],
+            "search_json": search["candidates"],
+        },
+    )
+    return search["order"], search["seasonal_order"]
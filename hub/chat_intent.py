@@ -0,0 +1,183 @@
+import re
+
+# --- LOCAL INTENT CLASSIFIER FOR CHAT ---
+# Most chat messages are obviously a greeting ("vanakkam", "thanks!") or
+# obviously a data question ("ethana per UPI use pannirukanga?"), so we
+# don't need a Gemini round trip to tell them apart. Every word of the
+# message is scored against two small vocabularies (English + Tanglish):
+#   - an exact match counts fully
+#   - otherwise the closest word by character trigrams counts partially,
+#     so spelling variants ("vanakam", "nanri", "thanku") still match
+# Words of the file's column names are data cues too. The confidence says
+# how clearly one side won; below the threshold the caller asks the LLM.
+
+GREETING = 'GREETING'
+DATA_QUERY = 'DATA_QUERY'
+
+GREETING_WORDS = {
+    'hi', 'hii', 'hai', 'hey', 'hello', 'helo', 'hola', 'yo', 'sup',
+    'good', 'morning', 'afternoon', 'evening', 'night', 'gm', 'gn',
+    'thanks', 'thank', 'thankyou', 'thanku', 'thx', 'ty', 'welcome',
+    'bye', 'goodbye', 'later', 'cya',
+    'ok', 'okay', 'cool', 'super', 'great', 'nice', 'awesome',
+    'vanakkam', 'nandri', 'sari', 'seri', 'romba', 'nanba',
+    'machi', 'machan', 'bro', 'anna', 'akka', 'sir', 'madam', 'da', 'pa',
+    'eppadi', 'epdi', 'irukeenga', 'irukinga', 'iruka', 'irukeengala',
+}
+
+# Whole phrases that are greetings even though their words look like a question
+GREETING_PHRASES = (
+    'how are you', 'how r u', 'whats up', "what's up", 'who are you',
+    'thank you', 'thanks a lot', 'so much', 'very much',
+    'eppadi irukeenga', 'epdi iruka', 'nalla irukeengala', 'saptingala',
+)
+
+DATA_WORDS = {
+    'how', 'many', 'much', 'which', 'who', 'when', 'where',
+    'total', 'sum', 'average', 'avg', 'mean', 'count', 'number',
+    'highest', 'lowest', 'most', 'least', 'top', 'best', 'worst', 'bottom',
+    'max', 'min', 'maximum', 'minimum', 'more', 'less', 'compare', 'trend',
+    'sales', 'sold', 'sell', 'revenue', 'profit', 'price', 'amount', 'value',
+    'orders', 'order', 'customers', 'customer', 'products', 'product',
+    'brand', 'brands', 'city', 'cities', 'category', 'month', 'year', 'quantity',
+    'show', 'list', 'give', 'tell', 'find', 'calculate',
+    # Tanglish
+    'ethana', 'evlo', 'evalo', 'evvalavu', 'motham', 'mothama', 'mothamaa',
+    'sarasari', 'adhigam', 'adhigama', 'kammi', 'kammiya', 'kuraivu', 'kuraivana',
+    'yaaru', 'yaar', 'evanga', 'entha', 'endha', 'enga', 'eppo',
+    'sollu', 'sollunga', 'kaatu', 'kaatunga', 'per', 'vithirukanga', 'vaangirukanga',
+    'pannirukanga', 'use',
+}
+
+# Words that mark a message as Tanglish, so replies can be phrased in it too.
+# Only whole Tamil words: bare suffixes like 'la' or 'ku' are also English
+# ("sales in LA"), so they are no evidence on their own.
+TANGLISH_WORDS = {
+    'ethana', 'evlo', 'evalo', 'evvalavu', 'motham', 'mothama', 'sarasari',
+    'adhigam', 'adhigama', 'kammi', 'kammiya', 'yaaru', 'entha', 'endha', 'enga',
+    'sollu', 'sollunga', 'kaatu', 'kaatunga', 'iruku', 'irukku', 'irukanga',
+    'pannirukanga', 'vithirukanga', 'vaangirukanga',
+    'vanakkam', 'nandri', 'romba', 'enna', 'eppadi', 'epdi',
+}
+
+# Words that say nothing either way
+FILLER_WORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'of', 'in', 'on', 'at', 'to',
+    'for', 'by', 'with', 'and', 'or', 'from', 'me', 'my', 'i', 'you', 'we', 'our',
+    'it', 'this', 'that', 'there', 'la', 'le', 'oda', 'ku', 'kku', 'um', 'na', 'nu',
+}
+
+KEYWORD_WEIGHT = 1.0
+COLUMN_WEIGHT = 1.5 # Naming a column is the clearest data cue there is
+PHRASE_WEIGHT = 2.0
+NUMBER_WEIGHT = 0.5
+QUESTION_MARK_WEIGHT = 0.5
+UNKNOWN_WORD_WEIGHT = 0.25 # Every word we can't place makes us less sure
+SMOOTHING = 0.25
+MIN_SIMILARITY = 0.5 # For the trigram (fuzzy) matches
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+CAMEL_CASE_PATTERN = re.compile(r'(?<=[a-z])(?=[A-Z])')
+
+
+def get_trigrams(word: str):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _build_vocabulary(words):
+    """
+    ({word: its trigrams}, {trigram: words containing it}).
+    The second map lets a fuzzy match only look at words that share a trigram.
+    """
+    word_trigrams = {word: get_trigrams(word) for word in words}
+    trigram_words = {}
+    for word, trigrams in word_trigrams.items():
+        for trigram in trigrams:
+            trigram_words.setdefault(trigram, []).append(word)
+    return word_trigrams, trigram_words
+
+
+GREETING_VOCABULARY = _build_vocabulary(GREETING_WORDS)
+DATA_VOCABULARY = _build_vocabulary(DATA_WORDS)
+
+
+def get_column_words(columns):
+    """
+    The lower-case words of the column names ('CustomerCity' -> customer, city).
+    """
+    words = set()
+    for col in columns or []:
+        for part in CAMEL_CASE_PATTERN.sub(' ', str(col)).lower().replace('_', ' ').split():
+            if len(part) > 2:
+                words.add(part)
+    return words
+
+
+def match_word(word: str, vocabulary):
+    """
+    1.0 for an exact match, the best trigram similarity for a close one, else 0.
+    """
+    word_trigrams, trigram_words = vocabulary
+    if word in word_trigrams:
+        return 1.0
+    if len(word) < 4:
+        return 0.0 # Too short to tell a typo from a different word
+    trigrams = get_trigrams(word)
+    shared = {}
+    for trigram in trigrams:
+        for candidate in trigram_words.get(trigram, ()):
+            shared[candidate] = shared.get(candidate, 0) + 1
+    best = 0.0
+    for candidate, common in shared.items():
+        # Jaccard similarity of the two trigram sets
+        similarity = common / (len(trigrams) + len(word_trigrams[candidate]) - common)
+        best = max(best, similarity)
+    return best if best >= MIN_SIMILARITY else 0.0
+
+
+def classify_intent(message: str, columns=None):
+    """
+    Returns (GREETING or DATA_QUERY or None, confidence between 0 and 1).
+    """
+    text = message.lower().strip()
+    if not TOKEN_PATTERN.search(text):
+        return None, 0.0
+    column_words = get_column_words(columns)
+
+    greeting_score = 0.0
+    for phrase in GREETING_PHRASES:
+        if phrase in text:
+            greeting_score += PHRASE_WEIGHT
+            text = text.replace(phrase, ' ') # Its words don't count again
+    data_score = QUESTION_MARK_WEIGHT if '?' in text else 0.0
+    words = TOKEN_PATTERN.findall(text)
+    unknown_words = 0
+    for word in words:
+        if word in FILLER_WORDS:
+            continue
+        if word.isdigit():
+            data_score += NUMBER_WEIGHT
+            continue
+        if word in column_words or word.rstrip('s') in column_words:
+            data_score += COLUMN_WEIGHT
+            continue
+        greeting_match = match_word(word, GREETING_VOCABULARY)
+        data_match = match_word(word, DATA_VOCABULARY)
+        if greeting_match == data_match == 0:
+            unknown_words += 1 # e.g. a filter value like 'Chennai'
+        elif greeting_match > data_match:
+            greeting_score += KEYWORD_WEIGHT * greeting_match
+        else:
+            data_score += KEYWORD_WEIGHT * data_match
+
+    if greeting_score == data_score == 0:
+        return None, 0.0
+    intent = GREETING if greeting_score > data_score else DATA_QUERY
+    winner = max(greeting_score, data_score)
+    confidence = winner / (greeting_score + data_score + UNKNOWN_WORD_WEIGHT * unknown_words + SMOOTHING)
+    return intent, round(confidence, 3)
+
+
+def is_tanglish(message: str):
+    return any(word in TANGLISH_WORDS for word in TOKEN_PATTERN.findall(message.lower()))
@@ -0,0 +1,90 @@
+import re
+from .chat_intent import is_tanglish
+
+# --- TEMPLATE NATURALIZER FOR CHAT ANSWERS ---
+# execute_json_query only ever answers four kinds of question (sum, mean,
+# count, groupby_agg), so the sentence around its number can be built from
+# the query JSON itself: the operation, the agg/groupby columns and the
+# filters. That replaces the Gemini "naturalizer" call with a string format,
+# in English or Tanglish depending on how the user asked.
+
+AGG_FUNC_WORDS = {
+    'en': {'sum': 'total', 'mean': 'average', 'count': 'count of'},
+    'ta': {'sum': 'motham', 'mean': 'sarasari', 'count': 'ennikkai'},
+}
+
+# What a COUNT counts, if the question names it ("how many customers ...")
+COUNT_NOUNS = ('customers', 'orders', 'transactions', 'products', 'sales', 'reviews', 'people', 'per', 'records')
+NOUN_PATTERN = re.compile(r"[a-z]+")
+
+
+def capitalize(sentence: str):
+    return sentence[:1].upper() + sentence[1:]
+
+
+def get_count_noun(user_message: str):
+    words = set(NOUN_PATTERN.findall(user_message.lower()))
+    for noun in COUNT_NOUNS:
+        if noun in words or noun.rstrip('s') in words:
+            return noun
+    return 'records'
+
+
+def describe_filters(query_json: dict, language: str):
+    """
+    ' where CustomerCity is Chennai and Brand is Sony' (en) or
+    'Chennai, Sony-la ' (ta); empty when there are no filters.
+    """
+    filters = [f for f in query_json.get('filters') or [] if f.get('column')]
+    if not filters:
+        return ''
+    if language == 'ta':
+        return ', '.join(str(f.get('value')) for f in filters) + '-la '
+    return ' where ' + ' and '.join(f"{f.get('column')} is {f.get('value')}" for f in filters)
+
+
+def naturalize_with_template(user_message: str, query_json: dict, data_answer: str):
+    """
+    Wraps a raw data answer into a sentence, without an AI call.
+    Returns the answer unchanged for operations it has no template for.
+    """
+    language = 'ta' if is_tanglish(user_message) else 'en'
+    operation = query_json.get('operation')
+    where = describe_filters(query_json, language)
+    agg_col = query_json.get('agg_col')
+
+    if operation == 'count':
+        noun = get_count_noun(user_message)
+        if language == 'ta':
+            return capitalize(f"{where}motham {data_answer} {noun} irukku.")
+        return f"There are {data_answer} {noun}{where}."
+
+    if operation in ('sum', 'mean'):
+        agg_word = AGG_FUNC_WORDS[language][operation]
+        if str(agg_col).lower().startswith(agg_word):
+            described = agg_col # Not "the total Total Price"
+        elif language == 'ta':
+            described = f"{agg_col} {agg_word}"
+        else:
+            described = f"{agg_word} {agg_col}"
+        if language == 'ta':
+            return capitalize(f"{where}{described}: {data_answer}.")
+        return f"The {described}{where} is {data_answer}."
+
+    if operation == 'groupby_agg':
+        groupby_col = query_json.get('groupby_col')
+        agg_func = query_json.get('agg_func')
+        if agg_func == 'idxmax':
+            if language == 'ta':
+                return capitalize(f"{where}adhigama {agg_col} irukkura {groupby_col}: {data_answer}.")
+            return f"The {groupby_col} with the highest {agg_col}{where} is {data_answer}."
+        # "Here are the Top 5 ...:" followed by the table; keep the table, reword the header
+        _, _, table = data_answer.partition('\n')
+        if not table:
+            return data_answer
+        agg_word = AGG_FUNC_WORDS[language].get(agg_func, agg_func)
+        if language == 'ta':
+            return capitalize(f"{where}{agg_word} {agg_col} adhigama irukkura Top 5 {groupby_col}:\n{table}")
+        return f"Here are the Top 5 {groupby_col} by {agg_word} {agg_col}{where}:\n{table}"
+
+    return data_answer
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.utils import timezone
+from .models import BackgroundJob, AnalysisResult, RetailFile
+from .ai_analyzer import perform_analysis
+from .ai_simulator import find_forecast_columns, get_tuned_order, run_saved_sales_forecast, run_segmented_forecast
+from .retail_data import load_retail_dataframe
+from datetime import timedelta
+import traceback
+
+# --- DB-BACKED BACKGROUND JOBS ---
+# Views queue a BackgroundJob and return straight away; the worker
+# (`python manage.py run_jobs`) claims queued jobs one at a time and runs
+# them. No broker is needed: the jobs table is the queue.
+
+JOB_TASKS = {} # {task name: function(job, **args) -> result dict}
+
+
+def job_task(name):
+    """
+    Registers a function as a job task.
+    """
+    def register(func):
+        JOB_TASKS[name] = func
+        return func
+    return register
+
+
+def set_progress(job, message):
+    """
+    Saves a progress message that the status page shows while the job runs.
+    """
+    job.progress = message
+    job.save(update_fields=['progress'])
+    print(f"Job {job.id}: {message}")
+
+
+@job_task('perform_analysis')
+def perform_analysis_task(job, uploaded_file_id):
+    set_progress(job, "Analyzing feedback with Gemini...")
+    perform_analysis(uploaded_file_id)
+    if not AnalysisResult.objects.filter(file_id=uploaded_file_id).exists():
+        raise RuntimeError("The analysis could not be completed. Please try uploading the file again.")
+    return {"uploaded_file_id": uploaded_file_id}
+
+
+@job_task('run_sales_forecast')
+def sales_forecast_task(job, retail_file_id):
+    """
+    The forecast page's work: find the forecast columns, then fit (or reuse)
+    the forecast. Returns the forecast data, or {"error": ...} for the page.
+    """
+    retail_file = RetailFile.objects.get(id=retail_file_id)
+    
+    set_progress(job, "Identifying the date and sales columns...")
+    column_names = find_forecast_columns(retail_file)
+    if "error" in column_names:
+        return {"error": f"AI Column-Finder failed: {column_names.get('error')}"}
+
+    sales_col = column_names.get('sales_col')
+    month_col = column_names.get('month_col')
+    year_col = column_names.get('year_col') # This can be null
+    if not month_col or not sales_col:
+        return {"error": f"AI failed to identify valid date/month or sales columns. Identified: {column_names}"}
+
+    try:
+        order = {}
+        if settings.RETAIL_FORECAST_AUTO_ORDER:
+            # Only searched the first time, then saved per file
+            set_progress(job, "Searching for the best SARIMA order...")
+            order['order'], order['seasonal_order'] = get_tuned_order(retail_file, sales_col, month_col, year_col)
+
+        set_progress(job, "Running the SARIMA forecast...")
+        forecast_data = run_saved_sales_forecast(retail_file, sales_col, month_col, year_col, **order)
+    except Exception as e:
+        return {"error": f"Error loading data file: {e}"}
+    
+    if "error" in forecast_data:
+        return {"error": f"Forecast Failed: {forecast_data.get('error')}"}
+    return forecast_data
+
+
+@job_task('run_segmented_forecast')
+def segmented_forecast_task(job, retail_file_id, segment_col):
+    """
+    One forecast per value of 'segment_col', fitted on the process pool.
+    """
+    retail_file = RetailFile.objects.get(id=retail_file_id)
+    
+    set_progress(job, "Identifying the date and sales columns...")
+    column_names = find_forecast_columns(retail_file)
+    if "error" in column_names:
+        return {"error": f"AI Column-Finder failed: {column_names.get('error')}"}
+
+    sales_col = column_names.get('sales_col')
+    month_col = column_names.get('month_col')
+    year_col = column_names.get('year_col')
+    if not month_col or not sales_col:
+        return {"error": f"AI failed to identify valid date/month or sales columns. Identified: {column_names}"}
+
+    set_progress(job, f"Forecasting each {segment_col}...")
+    df = load_retail_dataframe(retail_file, columns=[sales_col, month_col, year_col, segment_col])
+    return run_segmented_forecast(df, sales_col, month_col, year_col, segment_col)
+
+
+def enqueue_job(user, task, next_url='', **args):
+    """
+    Queues a job for the worker (or runs it now if BACKGROUND_JOBS_INLINE).
+    """
+    if task not in JOB_TASKS:
+        raise ValueError(f"Unknown job task '{task}'")
+    job = BackgroundJob.objects.create(user=user, task=task, args_json=args, next_url=next_url)
+    if settings.BACKGROUND_JOBS_INLINE and claim_job(job):
+        run_job(job)
+    return job
+
+
+def claim_job(job):
+    """
+    Marks a queued job as running. Returns False if another worker got it first.
+    """
+    claimed = BackgroundJob.objects.filter(id=job.id, status='queued').update(
+        status='running', started_at=timezone.now(), progress="Starting...",
+    )
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def fail_stale_jobs():
+    """
+    Fails the 'running' jobs whose worker died without finishing them (a
+    crash, an OOM kill, a restart), so nobody waits on them forever.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.BACKGROUND_JOBS_STALE_SECONDS)
+    stale = BackgroundJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='failed', progress="Failed.", finished_at=timezone.now(),
+        error="The worker stopped while running this job. Please try again.",
+    )
+    if stale:
+        print(f"Failed {stale} stale background job(s)")
+    return stale
+
+
+def delete_old_jobs():
+    """
+    Deletes finished jobs older than BACKGROUND_JOBS_KEEP_DAYS.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.BACKGROUND_JOBS_KEEP_DAYS)
+    deleted, _ = BackgroundJob.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def claim_next_job():
+    """
+    Claims the oldest queued job, or returns None if the queue is empty.
+    """
+    fail_stale_jobs()
+    while True:
+        job = BackgroundJob.objects.filter(status='queued').order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        if claim_job(job):
+            return job
+
+
+def run_job(job):
+    """
+    Runs a claimed job and saves its result (or its error).
+    """
+    try:
+        job.result_json = JOB_TASKS[job.task](job, **job.args_json)
+        job.status = 'done'
+        job.progress = "Finished."
+    except Exception as e:
+        traceback.print_exc()
+        job.status = 'failed'
+        job.error = str(e)
+        job.progress = "Failed."
+    job.finished_at = timezone.now()
+    # Only the fields the run owns (the view may set next_url meanwhile)
+    job.save(update_fields=['result_json', 'status', 'error', 'progress', 'finished_at'])
+    print(f"Job {job.id} ({job.task}) {job.status} in {(job.finished_at - job.started_at).total_seconds():.1f}s")
+    return job
@@ -0,0 +1,252 @@
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from collections import deque
+from datetime import timedelta
+from .models import LLMResponse, LLMCacheStats
+import hashlib
+import json
+import random
+import threading
+import time
+
+# --- SHARED GEMINI CLIENT ---
+# Every AI call in the hub goes through generate_text(), which gives them:
+#   - one configured client and model (the SDK reuses its connection)
+#   - one deadline for the whole call, and a few retries with jittered
+#     backoff for errors that are worth retrying (timeouts, rate limits,
+#     5xx). Each attempt, backoff and wait for a slot only gets the time
+#     that is left, so a synchronous request stays under the request limit
+#   - a limit on calls in flight and calls per minute (per process), so a
+#     burst of users queues up briefly instead of timing out every worker
+#   - a persistent cache: the same prompt to the same model is answered
+#     from the database (LLMResponse), with a TTL and LRU size eviction.
+#     Callers that parse the answer pass parse=..., so a reply that doesn't
+#     parse is never cached (and never replayed)
+
+api_key = settings.GOOGLE_AI_API_KEY
+if api_key:
+    genai.configure(api_key=api_key)
+model = genai.GenerativeModel(settings.GOOGLE_AI_MODEL)
+
+RETRYABLE_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests, # Includes ResourceExhausted (quota)
+    google_exceptions.InternalServerError,
+    ConnectionError,
+    TimeoutError,
+)
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 10.0
+MIN_ATTEMPT_SECONDS = 2.0 # Don't start an attempt with less time than this left
+
+
+class LLMError(Exception):
+    """
+    An AI call that failed (after its retries) or couldn't get a slot in time.
+    """
+
+
+class RateLimiter:
+    """
+    At most 'max_concurrent' calls at once and 'max_per_minute' calls in any
+    60 seconds. Callers wait (up to 'queue_seconds') for their turn.
+    """
+    def __init__(self, max_concurrent, max_per_minute, queue_seconds):
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.max_per_minute = max_per_minute
+        self.queue_seconds = queue_seconds
+        self.started = deque() # Start times of the calls in the last minute
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """
+        Waits at most 'queue_seconds' (or 'max_wait', if that is shorter).
+        """
+        queue_seconds = self.queue_seconds if max_wait is None else max(min(self.queue_seconds, max_wait), 0)
+        deadline = time.monotonic() + queue_seconds
+        if not self.slots.acquire(timeout=queue_seconds):
+            raise LLMError("The AI service is busy right now. Please try again in a moment.")
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self.started and now - self.started[0] >= 60:
+                    self.started.popleft()
+                if len(self.started) < self.max_per_minute:
+                    self.started.append(now)
+                    return
+                wait_seconds = 60 - (now - self.started[0])
+            if now + wait_seconds > deadline:
+                self.slots.release()
+                raise LLMError("The AI rate limit was reached. Please try again in a minute.")
+            time.sleep(wait_seconds)
+
+    def release(self):
+        self.slots.release()
+
+
+rate_limiter = RateLimiter(settings.LLM_MAX_CONCURRENT, settings.LLM_MAX_CALLS_PER_MINUTE, settings.LLM_QUEUE_SECONDS)
+
+
+class ResponseCache:
+    """
+    The DB-backed prompt/response cache. Hits and misses are counted in
+    this process and, for all processes, in the LLMCacheStats row.
+    """
+    STATS_ID = 1
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(model_name, prompt, response_mime_type=None):
+        key_text = f"{model_name}\n{prompt}"
+        if response_mime_type:
+            key_text = f"{response_mime_type}\n{key_text}"
+        return hashlib.sha256(key_text.encode()).hexdigest()
+
+    def get(self, key):
+        expired_before = timezone.now() - timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+        cached = LLMResponse.objects.filter(key=key, created_at__gte=expired_before).first()
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._count(hit=cached is not None)
+        if cached is None:
+            return None
+        LLMResponse.objects.filter(id=cached.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+        return cached.response_text
+
+    def _count(self, hit):
+        field = 'hits' if hit else 'misses'
+        counted = LLMCacheStats.objects.filter(id=self.STATS_ID).update(**{field: F(field) + 1})
+        if not counted:
+            LLMCacheStats.objects.get_or_create(id=self.STATS_ID)
+            LLMCacheStats.objects.filter(id=self.STATS_ID).update(**{field: F(field) + 1})
+
+    def reset_stats(self):
+        LLMCacheStats.objects.filter(id=self.STATS_ID).delete()
+
+    def delete(self, key):
+        LLMResponse.objects.filter(key=key).delete()
+
+    def put(self, key, model_name, response_text):
+        LLMResponse.objects.update_or_create(
+            key=key,
+            defaults={"model_name": model_name, "response_text": response_text,
+                      "created_at": timezone.now(), "last_used_at": timezone.now()},
+        )
+        with self._lock:
+            self.writes += 1
+            evict = self.writes % 100 == 1 # Check the size now and then, not on every write
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used ones over the size limit.
+        """
+        expired_before = timezone.now() - timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+        LLMResponse.objects.filter(created_at__lt=expired_before).delete()
+        over = LLMResponse.objects.count() - settings.LLM_CACHE_MAX_ENTRIES
+        if over > 0:
+            oldest = LLMResponse.objects.order_by('last_used_at').values_list('id', flat=True)[:over]
+            LLMResponse.objects.filter(id__in=list(oldest)).delete()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        saved = LLMCacheStats.objects.filter(id=self.STATS_ID).first()
+        total_hits = saved.hits if saved else 0
+        total_lookups = total_hits + (saved.misses if saved else 0)
+        return {
+            "entries": LLMResponse.objects.count(),
+            "max_entries": settings.LLM_CACHE_MAX_ENTRIES,
+            "hits": self.hits, # This process
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "total_hits": total_hits, # All processes, since 'since'
+            "total_misses": total_lookups - total_hits,
+            "total_hit_rate": total_hits / total_lookups if total_lookups else 0.0,
+            "since": saved.since if saved else None,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def is_configured():
+    return bool(api_key)
+
+
+def parse_json_response(response_text: str):
+    """
+    Parses Gemini's JSON answer, with or without a ```json fence around it.
+    Every prompt in the hub asks for a JSON object, so anything else is an error.
+    """
+    json_response_text = response_text.strip()
+    if json_response_text.startswith("```json"):
+        json_response_text = json_response_text[7:]
+    if json_response_text.endswith("```"):
+        json_response_text = json_response_text[:-3]
+    response_json = json.loads(json_response_text)
+    if not isinstance(response_json, dict):
+        raise ValueError(f"Expected a JSON object from the AI, got {type(response_json).__name__}.")
+    return response_json
+
+
+def generate_text(prompt: str, timeout: float = None, retries: int = None, cache: bool = True,
+                  response_mime_type: str = None, parse=None, deadline_seconds: float = None):
+    """
+    Sends one prompt to Gemini and returns the response text (from the
+    cache if this exact prompt was answered before, unless cache=False).
+    response_mime_type="application/json" asks for structured JSON output.
+    With parse=..., returns parse(text) instead, and only caches text that
+    parses (parse errors are raised to the caller).
+    'timeout' limits one attempt, 'deadline_seconds' the whole call.
+    Raises LLMError if it can't get an answer in time.
+    """
+    deadline = time.monotonic() + (deadline_seconds or settings.LLM_DEADLINE_SECONDS)
+    timeout = timeout or settings.LLM_TIMEOUT_SECONDS
+    retries = settings.LLM_MAX_RETRIES if retries is None else retries
+    
+    cache = cache and settings.LLM_CACHE_ENABLED
+    if cache:
+        cache_key = response_cache.get_key(model.model_name, prompt, response_mime_type)
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            if parse is None:
+                return cached_text
+            try:
+                return parse(cached_text)
+            except Exception as e:
+                # Cached before it was validated (or the parser changed), ask again
+                print(f"Cached AI response doesn't parse ({e}), dropping it")
+                response_cache.delete(cache_key)
+
+    generation_config = {"response_mime_type": response_mime_type} if response_mime_type else None
+    for attempt in range(retries + 1):
+        rate_limiter.acquire(max_wait=deadline - time.monotonic() - MIN_ATTEMPT_SECONDS)
+        try:
+            attempt_timeout = min(timeout, deadline - time.monotonic())
+            response = model.generate_content(prompt, generation_config=generation_config, request_options={"timeout": attempt_timeout})
+            response_text = response.text
+            result = response_text if parse is None else parse(response_text)
+            if cache:
+                response_cache.put(cache_key, model.model_name, response_text)
+            return result
+        except RETRYABLE_ERRORS as e:
+            # Exponential backoff with full jitter, so retries don't arrive together
+            backoff = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if attempt == retries or deadline - time.monotonic() - backoff < MIN_ATTEMPT_SECONDS:
+                raise LLMError(f"The AI service didn't answer after {attempt + 1} attempt(s): {e}") from e
+            print(f"AI call failed ({type(e).__name__}), retrying in {backoff:.1f}s...")
+            time.sleep(backoff)
+        finally:
+            rate_limiter.release()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from hub.llm_client import response_cache
+from hub.models import LLMResponse
+
+
+class Command(BaseCommand):
+    help = "Shows the Gemini response cache's size and hit rate, or clears it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Delete every cached response.")
+        parser.add_argument('--evict', action='store_true', help="Drop expired and over-limit responses now.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = LLMResponse.objects.all().delete()
+            response_cache.reset_stats()
+            self.stdout.write(f"Deleted {deleted} cached responses and reset the hit counters.")
+            return
+        if options['evict']:
+            response_cache.evict()
+        stats = response_cache.stats()
+        self.stdout.write(f"Entries: {stats['entries']} / {stats['max_entries']}")
+        if stats['since']:
+            self.stdout.write(
+                f"Hit rate since {stats['since']:%Y-%m-%d %H:%M}: {stats['total_hit_rate']:.1%} "
+                f"({stats['total_hits']} hits, {stats['total_misses']} misses)"
+            )
+        else:
+            self.stdout.write("No lookups counted yet.")
+        most_used = LLMResponse.objects.order_by('-hits')[:5]
+        for entry in most_used:
+            self.stdout.write(f"  {entry.hits:>6} hits  {entry.key[:12]}  {entry.response_text[:60]!r}")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from hub.jobs import claim_next_job, delete_old_jobs, run_job
+import time
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (feedback analysis, forecasts). No broker needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every queued job, then exit.")
+        parser.add_argument('--poll', type=float, default=settings.BACKGROUND_JOBS_POLL_SECONDS,
+                            help="Seconds to wait between checks of an empty queue.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Background job worker started.")
+        last_cleanup = 0
+        while True:
+            job = claim_next_job()
+            if job is not None:
+                run_job(job)
+                continue
+            if time.monotonic() - last_cleanup > 3600: # When idle, at most hourly
+                deleted = delete_old_jobs()
+                if deleted:
+                    self.stdout.write(f"Deleted {deleted} old finished jobs.")
+                last_cleanup = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+        self.stdout.write("Job queue is empty.")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_retailfile_chatmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retailfile',
+            name='ingest_stats',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
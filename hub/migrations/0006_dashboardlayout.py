@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0005_retailfile_ingest_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_hash', models.CharField(max_length=64, unique=True)),
+                ('layout_json', models.JSONField()),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0006_dashboardlayout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardChartData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layout_version', models.PositiveIntegerField()),
+                ('dataset_version', models.CharField(max_length=64)),
+                ('chart_data', models.JSONField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('layout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hub.dashboardlayout')),
+                ('retail_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='hub.retailfile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0009_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sales_col', models.CharField(max_length=255)),
+                ('month_col', models.CharField(max_length=255)),
+                ('year_col', models.CharField(blank=True, default='', max_length=255)),
+                ('order', models.JSONField()),
+                ('seasonal_order', models.JSONField()),
+                ('cv_error', models.FloatField()),
+                ('search_json', models.JSONField()),
+                ('searched_at', models.DateTimeField(auto_now=True)),
+                ('retail_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hub.retailfile')),
+            ],
+            options={
+                'unique_together': {('retail_file', 'sales_col', 'month_col', 'year_col')},
+            },
+        ),
+    ]
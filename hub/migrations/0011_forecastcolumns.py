@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0010_forecastorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastColumns',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_hash', models.CharField(max_length=64, unique=True)),
+                ('columns_json', models.JSONField()),
+                ('source', models.CharField(max_length=16)),
+                ('confidence', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0012_llmresponse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('misses', models.PositiveBigIntegerField(default=0)),
+                ('since', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0013_llmcachestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='served_by',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+import hashlib
+import json
 
 # Create your models here.
 class UploadedFile(models.Model):
@@ -39,6 +41,21 @@ class RetailFile(models.Model):
     # We will store the column names and data types as a JSON string
     # This is so the AI knows the "schema" of the file
     schema_json = models.JSONField(null=True, blank=True)
+    
+    # Memory report from the dtype optimisation at upload
+    # (e.g. {"memory_before": ..., "memory_after": ..., "converted_columns": {...}})
+    ingest_stats = models.JSONField(null=True, blank=True)
+
+    @property
+    def schema_hash(self):
+        """
+        A fingerprint of the schema: files with the same columns and types
+        share it, so they can share anything planned from the schema alone.
+        """
+        if not self.schema_json:
+            return None
+        schema_string = json.dumps(self.schema_json, sort_keys=True)
+        return hashlib.sha256(schema_string.encode()).hexdigest()
 
     def __str__(self):
         return f"RetailFile ({self.id}) for {self.user.username}"
@@ -53,8 +70,151 @@ class ChatMessage(models.Model):
     
     # Who sent it?
     is_from_user = models.BooleanField(default=True)
+    # For data answers: how the number was found ('cache', 'cube', 'index' or 'frame')
+    served_by = models.CharField(max_length=16, blank=True, default='')
     
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Message for {self.retail_file_id} (User: {self.is_from_user})"
\ No newline at end of file
+        return f"Message for {self.retail_file_id} (User: {self.is_from_user})"
+
+class DashboardLayout(models.Model):
+    # The AI planner's chart plan for one schema (see RetailFile.schema_hash),
+    # shared by every file with that schema
+    schema_hash = models.CharField(max_length=64, unique=True)
+    layout_json = models.JSONField()
+    
+    # Bumped every time the layout is regenerated
+    version = models.PositiveIntegerField(default=1)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard layout v{self.version} for schema {self.schema_hash[:12]}"
+
+class DashboardChartData(models.Model):
+    # The executed charts (titles, labels, values) of one file's dashboard,
+    # valid only for the layout version and file version they were computed from
+    retail_file = models.OneToOneField(RetailFile, on_delete=models.CASCADE)
+    layout = models.ForeignKey(DashboardLayout, on_delete=models.CASCADE)
+    layout_version = models.PositiveIntegerField()
+    dataset_version = models.CharField(max_length=64)
+    chart_data = models.JSONField()
+    
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard charts for RetailFile {self.retail_file_id} (layout v{self.layout_version})"
+
+class SalesForecast(models.Model):
+    # A fitted forecast for one file, column choice and model order,
+    # valid only for the file version it was fitted on
+    retail_file = models.ForeignKey(RetailFile, on_delete=models.CASCADE)
+    sales_col = models.CharField(max_length=255)
+    month_col = models.CharField(max_length=255)
+    year_col = models.CharField(max_length=255, blank=True, default='')
+    model_order = models.CharField(max_length=64) # e.g. '(1, 1, 1)x(1, 1, 0, 12)'
+    
+    dataset_version = models.CharField(max_length=64)
+    forecast_json = models.JSONField() # What the forecast page shows
+    params_json = models.JSONField() # The fitted model parameters {name: value}
+    
+    fitted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('retail_file', 'sales_col', 'month_col', 'year_col', 'model_order')
+
+    def __str__(self):
+        return f"SARIMA{self.model_order} forecast for RetailFile {self.retail_file_id}"
+
+class ForecastColumns(models.Model):
+    # The month/year/sales columns for one schema (see RetailFile.schema_hash),
+    # found by the local detector or, if it wasn't sure, by the AI
+    schema_hash = models.CharField(max_length=64, unique=True)
+    columns_json = models.JSONField() # {"month_col": ..., "year_col": ..., "sales_col": ...}
+    source = models.CharField(max_length=16) # 'detector' or 'ai'
+    confidence = models.FloatField() # The detector's confidence
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Forecast columns ({self.source}) for schema {self.schema_hash[:12]}"
+
+class ForecastOrder(models.Model):
+    # The SARIMA order that won the cross-validated search for one file and
+    # column choice, so later forecasts skip the search
+    retail_file = models.ForeignKey(RetailFile, on_delete=models.CASCADE)
+    sales_col = models.CharField(max_length=255)
+    month_col = models.CharField(max_length=255)
+    year_col = models.CharField(max_length=255, blank=True, default='')
+    
+    order = models.JSONField() # e.g. [1, 1, 1]
+    seasonal_order = models.JSONField() # e.g. [1, 1, 0, 12]
+    cv_error = models.FloatField() # Mean absolute out-of-sample error
+    search_json = models.JSONField() # Every candidate tried, best first
+    
+    searched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('retail_file', 'sales_col', 'month_col', 'year_col')
+
+    def __str__(self):
+        return f"SARIMA{tuple(self.order)}x{tuple(self.seasonal_order)} for RetailFile {self.retail_file_id}"
+
+# --- GEMINI RESPONSE CACHE (see hub/llm_client.py) ---
+
+class LLMResponse(models.Model):
+    # sha256 of the model name + prompt, so identical calls share one row
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100)
+    response_text = models.TextField()
+    
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True) # For the TTL
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True) # For the LRU eviction
+
+    def __str__(self):
+        return f"Cached {self.model_name} response {self.key[:12]} ({self.hits} hits)"
+
+class LLMCacheStats(models.Model):
+    # A single row: the response cache's lookups, counted by every process
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    since = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"LLM cache: {self.hits} hits, {self.misses} misses since {self.since:%Y-%m-%d}"
+
+# --- BACKGROUND JOBS (see hub/jobs.py) ---
+
+class BackgroundJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task = models.CharField(max_length=64) # A name from hub.jobs.JOB_TASKS
+    args_json = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    progress = models.CharField(max_length=255, blank=True, default='') # e.g. "Training SARIMA model..."
+    result_json = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    
+    # Where the status page sends the user once the job is finished
+    next_url = models.CharField(max_length=255, blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def __str__(self):
+        return f"Job {self.id} ({self.task}, {self.status})"
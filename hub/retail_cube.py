@@ -0,0 +1,180 @@
+import pandas as pd
+from itertools import combinations
+from .retail_index import normalize_value
+
+# --- PRE-AGGREGATED OLAP CUBE ---
+# Most chat questions are "sum/mean/count of X where City = ... and Brand = ...".
+# At ingest we pre-compute, for every combination of up to N low-cardinality
+# dimensions (categorical columns), the sum and count of every numeric
+# measure. Those questions are then answered from a few hundred cube rows
+# instead of the whole file.
+#
+# The cube is ONE small DataFrame:
+#   - one column per dimension (empty when that dimension is rolled up)
+#   - '__grouping': the dimensions of the row, e.g. 'Brand,CustomerCity'
+#   - '__rows': the number of file rows in that cell
+#   - '<measure>__sum' and '<measure>__count' for every measure
+
+GROUPING_COLUMN = '__grouping'
+ROWS_COLUMN = '__rows'
+SUM_SUFFIX = '__sum'
+COUNT_SUFFIX = '__count'
+
+
+class CubeBuilder:
+    """
+    Builds the cube batch by batch during ingest. Sums and counts add up,
+    so each batch's partial cube is merged into the running totals and
+    memory stays at the size of the cube itself.
+    """
+    def __init__(self, dimensions, measures, max_dims):
+        self.dimensions = sorted(dimensions)
+        self.measures = list(measures)
+        self.groupings = [
+            grouping
+            for size in range(min(max_dims, len(self.dimensions)) + 1)
+            for grouping in combinations(self.dimensions, size)
+        ]
+        self.totals = {} # {grouping: DataFrame of sums/counts, indexed by its dimensions}
+
+    def add(self, chunk: pd.DataFrame):
+        # Accumulate in 64 bits, whatever the compact storage dtype is
+        values = chunk[self.measures].astype({
+            col: 'float64' for col in self.measures if pd.api.types.is_float_dtype(chunk[col].dtype)
+        })
+        for grouping in self.groupings:
+            if grouping:
+                # Dimensions are categoricals, so this groups on their codes
+                keys = [chunk[col] for col in grouping]
+                grouped = values.groupby(keys, observed=True, dropna=True)
+                partial = pd.concat([
+                    grouped.sum().add_suffix(SUM_SUFFIX),
+                    grouped.count().add_suffix(COUNT_SUFFIX),
+                    grouped.size().rename(ROWS_COLUMN),
+                ], axis=1)
+            else:
+                partial = pd.DataFrame([{
+                    **{f"{col}{SUM_SUFFIX}": values[col].sum() for col in self.measures},
+                    **{f"{col}{COUNT_SUFFIX}": values[col].count() for col in self.measures},
+                    ROWS_COLUMN: len(values),
+                }])
+
+            total = self.totals.get(grouping)
+            if total is None:
+                self.totals[grouping] = partial
+            elif grouping:
+                levels = list(range(len(grouping)))
+                self.totals[grouping] = pd.concat([total, partial]).groupby(level=levels, observed=True).sum()
+            else:
+                self.totals[grouping] = total + partial
+
+    def result(self):
+        """
+        The finished cube as one DataFrame.
+        """
+        parts = []
+        for grouping, total in self.totals.items():
+            part = total.reset_index(drop=not grouping)
+            if grouping:
+                part.columns = list(grouping) + list(total.columns)
+            part[GROUPING_COLUMN] = ','.join(grouping)
+            parts.append(part)
+        cube = pd.concat(parts, ignore_index=True)
+        for col in self.dimensions:
+            if col not in cube.columns:
+                cube[col] = None
+            # Plain text, so rolled-up cells can be empty
+            cube[col] = cube[col].astype(object).map(lambda value: None if pd.isna(value) else str(value))
+        return cube
+
+
+def get_cube_columns(cube: pd.DataFrame):
+    """
+    Returns ({lower: dimension}, {lower: measure}) for a cube.
+    """
+    measures = [col[:-len(SUM_SUFFIX)] for col in cube.columns if col.endswith(SUM_SUFFIX)]
+    reserved = {GROUPING_COLUMN, ROWS_COLUMN}
+    dimensions = [
+        col for col in cube.columns
+        if col not in reserved and not col.endswith(SUM_SUFFIX) and not col.endswith(COUNT_SUFFIX)
+    ]
+    return {col.lower(): col for col in dimensions}, {col.lower(): col for col in measures}
+
+
+def execute_cube_query(cube: pd.DataFrame, query_json: dict):
+    """
+    Answers a chat JSON query from the cube, in the same format as
+    execute_json_query. Returns None when the query doesn't fit the cube
+    (e.g. idxmax, a filter on a non-dimension, too many dimensions), so the
+    caller can fall back to the raw data.
+    """
+    if cube is None:
+        return None
+    dimensions, measures = get_cube_columns(cube)
+
+    operation = query_json.get("operation")
+    if operation not in ('sum', 'mean', 'count', 'groupby_agg'):
+        return None
+
+    filters = []
+    for f in query_json.get('filters') or []:
+        dim = dimensions.get(str(f.get('column')).lower())
+        if dim is None:
+            return None
+        filters.append((dim, normalize_value(f.get('value'))))
+    filter_dims = [dim for dim, _ in filters]
+    if len(set(filter_dims)) != len(filter_dims):
+        return None
+    if any(value in ('nan', 'none') for _, value in filters):
+        return None # Empty cells are not part of any cube cell
+
+    group_dim = None
+    if operation == 'groupby_agg':
+        if query_json.get('agg_func') not in ('sum', 'mean', 'count'):
+            return None
+        group_dim = dimensions.get(str(query_json.get('groupby_col')).lower())
+        if group_dim is None or group_dim in filter_dims:
+            return None
+
+    measure = None
+    if operation != 'count':
+        measure = measures.get(str(query_json.get('agg_col')).lower())
+        if measure is None:
+            return None
+
+    grouping = ','.join(sorted(filter_dims + ([group_dim] if group_dim else [])))
+    is_grouping = cube[GROUPING_COLUMN] == grouping
+    if not is_grouping.any():
+        return None # This combination of dimensions wasn't materialised
+    cells = cube[is_grouping]
+    for dim, value in filters:
+        cells = cells[cells[dim].astype(str).str.lower() == value]
+
+    if operation == 'count':
+        return f"{int(cells[ROWS_COLUMN].sum())}"
+
+    sums = cells[f"{measure}{SUM_SUFFIX}"]
+    counts = cells[f"{measure}{COUNT_SUFFIX}"]
+
+    if operation == 'sum':
+        return f"{sums.sum():,.2f}"
+    if operation == 'mean':
+        total_count = counts.sum()
+        result = sums.sum() / total_count if total_count else float('nan')
+        return f"{result:,.2f}"
+
+    # groupby_agg: one value per group, then the Top 5 like the raw executor
+    group_sums = sums.groupby(cells[group_dim]).sum()
+    group_counts = counts.groupby(cells[group_dim]).sum()
+    agg_func = query_json.get('agg_func')
+    if agg_func == 'sum':
+        result_series = group_sums
+    elif agg_func == 'count':
+        result_series = group_counts
+    else:
+        result_series = group_sums / group_counts
+    result_series.index.name = group_dim
+    result_series.name = measure
+
+    result = result_series.nlargest(5)
+    return f"Here are the Top 5 {query_json.get('groupby_col')} by {query_json.get('agg_col')}:\n{result.to_string()}"
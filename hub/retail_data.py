@@ -0,0 +1,802 @@
+from django.conf import settings
+from collections import OrderedDict
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import pandas as pd
+import numpy as np
+import openpyxl
+from pandas.tseries.api import guess_datetime_format
+from .retail_index import ValueIndex
+from .retail_cube import CubeBuilder
+import threading
+import os
+import re
+import warnings
+
+# --- RETAIL DATA LOADER ---
+# Every retail feature (chat, dashboard, forecast) loads its DataFrame
+# through this module. The raw .csv/.xlsx upload is parsed ONCE and saved
+# as a typed, columnar Parquet "sidecar" next to it. Later requests read
+# only the columns they need from the sidecar, and the columns stay in a
+# process-wide, memory-budgeted cache between requests.
+#
+# With RETAIL_DATASET_STORAGE = 'mmap' the sidecar is an uncompressed Arrow
+# IPC file instead. Workers memory-map it and build their numeric and
+# categorical columns on top of the mapped pages without copying, so the OS
+# page cache holds ONE copy of them no matter how many gunicorn workers
+# serve the file. Free-text columns are the exception: pandas turns them
+# into Python string objects, which every worker holds privately.
+
+SIDECAR_EXTENSIONS = {
+    'parquet': '.parquet',
+    'mmap': '.arrow',
+}
+
+
+# --- PROCESS-WIDE DATAFRAME CACHE ---
+
+class _CacheEntry:
+    """
+    The columns of one dataset version that have been loaded so far.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.columns = {} # {column name: Series}
+        self.complete = False # True once every column of the file is loaded
+        self.frame_nbytes = 0
+        self.value_index = ValueIndex() # Filter indexes for these columns
+
+    @property
+    def nbytes(self):
+        return self.frame_nbytes + self.value_index.nbytes
+
+    def has(self, columns):
+        if columns is None:
+            return self.complete
+        return all(col in self.columns for col in columns)
+
+    def frame(self, columns):
+        if columns is None:
+            columns = list(self.columns)
+        # A new DataFrame object, so callers can add columns without
+        # touching the cached ones
+        return pd.DataFrame({col: self.columns[col] for col in columns}, index=self.index, copy=False)
+
+
+class DataFrameCache:
+    """
+    An LRU cache of retail DataFrames shared by every request in this process.
+
+    Keys are (RetailFile.id, dataset version), so a replaced file never
+    serves old data. The size of each entry is measured with
+    DataFrame.memory_usage(deep=True); the least recently used entries are
+    evicted once the total goes over 'max_bytes'.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # {key: _CacheEntry}, oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, columns=None, count=True):
+        """
+        Returns the cached frame (projected to 'columns'), or None on a miss.
+        'count=False' skips the hit/miss counters (for internal re-reads).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.has(columns):
+                self.misses += count
+                return None
+            self._entries.move_to_end(key)
+            self.hits += count
+            return entry.frame(columns)
+
+    def cached_columns(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return list(entry.columns) if entry else []
+
+    def put(self, key, df: pd.DataFrame, complete=False):
+        """
+        Adds the columns of 'df' to the entry for 'key'.
+        'complete' means 'df' holds every column of the file.
+        """
+        nbytes = int(df.memory_usage(deep=True, index=False).sum())
+        if nbytes > self.max_bytes:
+            print(f"DataFrame for {key} ({nbytes} bytes) is bigger than the cache budget, not caching it.")
+            return
+
+        with self._lock:
+            # Drop older versions of the same file, they can never be hit again
+            for old_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[old_key]
+
+            entry = self._entries.get(key)
+            if entry is None or len(entry.index) != len(df.index):
+                entry = _CacheEntry(df.index)
+                self._entries[key] = entry
+            if complete:
+                # Keep the file's own column order
+                entry.columns = {col: df[col] for col in df.columns}
+                entry.complete = True
+            else:
+                for col in df.columns:
+                    entry.columns[col] = df[col]
+            entry.frame_nbytes = int(entry.frame(None).memory_usage(deep=True, index=False).sum())
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            old_key, old_entry = self._entries.popitem(last=False)
+            total -= old_entry.nbytes
+            self.evictions += 1
+            print(f"DataFrame cache: evicted {old_key} ({old_entry.nbytes} bytes)")
+
+    def get_value_index(self, key):
+        """
+        The ValueIndex of a cached dataset version (it lives and is evicted
+        together with the frame), or None if the dataset isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._evict()
+            return entry.value_index
+
+    def invalidate(self, retail_file_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == retail_file_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.nbytes for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+dataframe_cache = DataFrameCache(settings.RETAIL_DATAFRAME_CACHE_BYTES)
+
+
+def get_dataset_version(retail_file):
+    """
+    A token that changes whenever the raw upload is replaced or modified.
+    """
+    stat = os.stat(retail_file.file.path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def get_value_index(retail_file):
+    """
+    Returns the filter index for the current version of a RetailFile.
+    If the data isn't cached (e.g. it's bigger than the budget) we return a
+    fresh index that only lives for this request.
+    """
+    value_index = dataframe_cache.get_value_index((retail_file.id, get_dataset_version(retail_file)))
+    return value_index if value_index is not None else ValueIndex()
+
+
+def get_sidecar_path(retail_file):
+    """
+    Returns the path of the sidecar for a RetailFile.
+    (e.g. 'retail_uploads/sales.csv' -> 'retail_uploads/sales.csv.parquet')
+    """
+    return retail_file.file.path + SIDECAR_EXTENSIONS[settings.RETAIL_DATASET_STORAGE]
+
+
+def is_sidecar_fresh(retail_file):
+    """
+    True if the sidecar exists and is newer than the raw upload.
+    """
+    sidecar_path = get_sidecar_path(retail_file)
+    if not os.path.exists(sidecar_path):
+        return False
+    return os.path.getmtime(sidecar_path) >= os.path.getmtime(retail_file.file.path)
+
+
+def read_raw_file(file_path, columns=None):
+    """
+    Parses the whole raw .csv/.xlsx upload into memory. This is only a
+    fallback for when the sidecar can't be built or read.
+    """
+    if not columns:
+        columns = None # An empty projection would also drop the rows
+    if file_path.endswith('.csv'):
+        return pd.read_csv(file_path, usecols=columns)
+    return pd.read_excel(file_path, usecols=columns)
+
+
+def iter_raw_chunks(file_path, dtype=None):
+    """
+    Streams the raw upload as DataFrames of at most
+    RETAIL_INGEST_CHUNK_ROWS rows, so a 2 GB file never has to fit in memory.
+    'dtype' is passed to the CSV parser ({column: dtype}).
+    """
+    chunk_rows = settings.RETAIL_INGEST_CHUNK_ROWS
+    if file_path.endswith('.csv'):
+        yield from pd.read_csv(file_path, chunksize=chunk_rows, dtype=dtype)
+        return
+
+    # pandas can't read .xlsx in chunks, so we stream the rows with openpyxl
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(col) for col in next(rows, [])]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+# --- STREAMING DTYPE INFERENCE (runs once, at ingest) ---
+# Pass 1 reads the upload batch by batch and reconciles what each column
+# looks like across ALL batches (e.g. int in batch 1, float in batch 7).
+# Pass 2 reads it again, converts every batch to the final compact dtypes
+# and appends it to the sidecar. Peak memory is a couple of batches.
+
+# A text column becomes a categorical when at most this share of its values are distinct
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# ...and it has at most this many distinct values (this also bounds pass 1's memory)
+CATEGORY_MAX_VALUES = 50000
+DATE_NAME_HINTS = ('date', 'time', 'timestamp')
+DATE_VALUE_PATTERN = re.compile(r'^(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4})')
+# A date column must parse at least this share of its values, in EVERY batch
+DATE_MIN_PARSED_RATIO = 0.9
+
+
+def _looks_like_dates(col_name, non_null: pd.Series):
+    if any(hint in str(col_name).lower() for hint in DATE_NAME_HINTS):
+        return True
+    sample = non_null.head(100).astype(str)
+    return bool(sample.str.match(DATE_VALUE_PATTERN).mean() > 0.9)
+
+
+def _guess_date_formats(text: pd.Series):
+    """
+    The candidate formats of a date column, guessed from a sample of its
+    values both month-first and day-first ('05/02/2023' is ambiguous on its
+    own, '25/02/2023' is not). All batches are then parsed with the ONE
+    format that fits them best, instead of pandas guessing per batch.
+    Ordered month-first first, so a tie ('2023-01-05' fits %Y-%m-%d and
+    %Y-%d-%m alike) is always decided the same way, like pandas does.
+    """
+    formats = {} # An ordered set
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore') # "Parsing dates in %d/%m/%Y format when dayfirst=False..."
+        for value in text.head(100):
+            for dayfirst in (False, True):
+                date_format = guess_datetime_format(value, dayfirst=dayfirst)
+                if date_format:
+                    formats[date_format] = None
+    if any(date_format.startswith('%Y-%m-%d') for date_format in formats):
+        formats['ISO8601'] = None # Mixed precision, e.g. with and without a time
+    return list(formats)
+
+
+def _smallest_int_dtype(low, high):
+    for dtype in ('int8', 'int16', 'int32', 'int64'):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return 'uint64'
+
+
+class _ColumnProfile:
+    """
+    What one column looks like, gathered batch by batch.
+    'kind' is one of 'bool', 'int', 'float', 'datetime' or 'text'.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.raw_dtypes = set()
+        self.non_null = 0
+        self.nulls = 0
+        self.int_min = None
+        self.int_max = None
+        self.float32_safe = True
+        self.values = set() # distinct text values, while there are few enough
+        self.mixed = False # some batches were numbers, some were text
+        self.date_candidate = None
+        self.date_formats = None # {format: values parsed}, for a date candidate
+        self.date_format = None # The one format pass 2 parses with
+
+    def update(self, series: pd.Series):
+        self.raw_dtypes.add(str(series.dtype))
+        non_null = series.dropna()
+        self.nulls += len(series) - len(non_null)
+        if non_null.empty:
+            return # An all-empty batch tells us nothing about the type (only that it has nulls)
+        self.non_null += len(non_null)
+
+        dtype = series.dtype
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.infer_dtype(non_null) == 'boolean':
+            kind = 'bool' # The CSV parser reads True/False with empty cells as objects
+        elif pd.api.types.is_integer_dtype(dtype):
+            kind = 'int'
+            low, high = int(non_null.min()), int(non_null.max())
+            self.int_min = low if self.int_min is None else min(self.int_min, low)
+            self.int_max = high if self.int_max is None else max(self.int_max, high)
+        elif pd.api.types.is_float_dtype(dtype):
+            kind = 'float'
+            if self.float32_safe:
+                self.float32_safe = bool((non_null.astype('float32').astype('float64') == non_null).all())
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            kind = 'datetime'
+        else:
+            kind = 'text'
+            text = non_null.astype(str)
+            if self.date_candidate is None:
+                self.date_candidate = _looks_like_dates(self.name, text)
+                if self.date_candidate:
+                    self.date_formats = {date_format: 0 for date_format in _guess_date_formats(text)}
+            if self.date_candidate:
+                self._count_dates(text)
+            if len(self.values) <= CATEGORY_MAX_VALUES:
+                self.values.update(text.unique())
+
+        self._reconcile(kind)
+
+    def _count_dates(self, text: pd.Series):
+        for date_format in list(self.date_formats):
+            parsed = int(pd.to_datetime(text, format=date_format, errors='coerce').notna().sum())
+            if parsed < DATE_MIN_PARSED_RATIO * len(text):
+                del self.date_formats[date_format] # Doesn't fit this batch, so it can't be used
+            else:
+                self.date_formats[date_format] += parsed
+
+    def _reconcile(self, kind):
+        if self.kind is None or self.kind == kind:
+            self.kind = kind
+        elif {self.kind, kind} == {'int', 'float'}:
+            self.kind = 'float'
+        else:
+            # Anything else (numbers + text, dates + text, ...) is stored as text
+            self.mixed = True
+            self.kind = 'text'
+
+    def final_dtype(self):
+        """
+        The compact dtype every batch is converted to in pass 2.
+        """
+        if self.kind == 'int':
+            if self.nulls:
+                return 'float64' # Empty cells (like pandas does for ints with NaN)
+            return _smallest_int_dtype(self.int_min, self.int_max)
+        if self.kind == 'float':
+            return 'float32' if self.float32_safe else 'float64'
+        if self.kind == 'bool':
+            return 'boolean' if self.nulls else 'bool'
+        if self.kind == 'datetime':
+            return 'datetime64[ns]'
+        if self.kind == 'text':
+            if self.get_date_format():
+                return 'datetime64[ns]'
+            if (not self.mixed and len(self.values) <= CATEGORY_MAX_VALUES
+                    and len(self.values) <= CATEGORY_MAX_UNIQUE_RATIO * self.non_null):
+                return pd.CategoricalDtype(sorted(self.values))
+            return 'object'
+        return 'float64' # The column was empty in every batch
+
+    def get_date_format(self):
+        """
+        The format that parsed the most values (and enough in every batch), or None.
+        On a tie, the first one guessed.
+        """
+        if not self.date_formats:
+            return None
+        return max(self.date_formats, key=lambda date_format: self.date_formats[date_format])
+
+    def parse_dtype(self):
+        """
+        The dtype the CSV parser should use in pass 2.
+        Text-like columns are read as plain strings, so the values match
+        exactly what pass 1 saw.
+        """
+        if self.kind == 'int' and not self.nulls:
+            return 'uint64' if self.final_dtype() == 'uint64' else 'int64'
+        if self.kind == 'bool':
+            return self.final_dtype()
+        if self.kind in ('int', 'float', None):
+            return 'float64'
+        return str
+
+
+def as_float64(values):
+    """
+    Widens float32 columns (a Series or a DataFrame) to float64 before they
+    are aggregated. Every float32 value in the sidecar is exact, but pandas
+    adds float32 values up in float32, so a sum over millions of rows would
+    lose digits. (CubeBuilder.add does the same at ingest.)
+    """
+    if isinstance(values, pd.DataFrame):
+        return values.astype({col: 'float64' for col in values.columns if values[col].dtype == 'float32'})
+    return values.astype('float64') if values.dtype == 'float32' else values
+
+
+def _convert_chunk(chunk: pd.DataFrame, profiles: dict):
+    converted = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        target = profiles[col].final_dtype()
+        if isinstance(target, pd.CategoricalDtype):
+            text = series.where(series.isna(), series.astype(str))
+            series = text.astype(target)
+            if series.isna().sum() != text.isna().sum():
+                raise ValueError(f"Column '{col}' has values that were not seen while profiling.")
+        elif target == 'datetime64[ns]':
+            series = pd.to_datetime(series, format=profiles[col].date_format, errors='coerce')
+        elif target == 'object':
+            series = series.where(series.isna(), series.astype(str)).astype(object)
+        else:
+            series = series.astype(target)
+        converted[col] = series
+    return pd.DataFrame(converted, index=chunk.index)
+
+
+class _SidecarWriter:
+    """
+    Appends batches to a Parquet or Arrow IPC sidecar.
+    It writes to a temp file and renames it on close(), so other workers
+    never see (or memory-map) a half-written sidecar.
+    """
+    def __init__(self, sidecar_path):
+        self.sidecar_path = sidecar_path
+        self.tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        self.is_arrow = sidecar_path.endswith(SIDECAR_EXTENSIONS['mmap'])
+        self.schema = None
+        self._sink = None
+        self._writer = None
+
+    def write(self, chunk: pd.DataFrame):
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            # A text column that is empty in the first batch must still be text
+            fields = [pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema]
+            self.schema = pa.schema(fields, metadata=schema.metadata)
+            if self.is_arrow:
+                self._sink = pa.OSFile(self.tmp_path, 'wb')
+                self._writer = pa.ipc.new_file(self._sink, self.schema)
+            else:
+                self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        self._writer.write_table(pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self._writer is None:
+            raise ValueError("The file has no rows to ingest.")
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        os.replace(self.tmp_path, self.sidecar_path)
+
+    def abort(self):
+        try:
+            if self._writer is not None:
+                self._writer.close()
+            if self._sink is not None:
+                self._sink.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+# --- OPTIONAL OLAP CUBE (see hub/retail_cube.py) ---
+
+CUBE_EXTENSION = '.cube.parquet'
+_cube_cache = OrderedDict() # {(RetailFile.id, dataset version): cube DataFrame}
+_cube_cache_lock = threading.Lock()
+CUBE_CACHE_SIZE = 32
+
+
+def get_cube_path(retail_file):
+    return retail_file.file.path + CUBE_EXTENSION
+
+
+def _get_cube_builder(profiles: dict):
+    """
+    Picks the cube's dimensions (categoricals with few values) and measures
+    (numeric columns). Returns None if the cube is disabled or has nothing to do.
+    """
+    if not settings.RETAIL_CUBE_ENABLED:
+        return None
+    dimensions = []
+    measures = []
+    for col, profile in profiles.items():
+        dtype = profile.final_dtype()
+        if isinstance(dtype, pd.CategoricalDtype):
+            if len(dtype.categories) <= settings.RETAIL_CUBE_MAX_CARDINALITY:
+                dimensions.append(col)
+        elif profile.kind in ('int', 'float'):
+            measures.append(col)
+    if not dimensions:
+        return None
+    return CubeBuilder(dimensions, measures, settings.RETAIL_CUBE_MAX_DIMS)
+
+
+def _write_cube(cube: pd.DataFrame, cube_path):
+    tmp_path = f"{cube_path}.{os.getpid()}.tmp"
+    try:
+        cube.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cube_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_retail_cube(retail_file):
+    """
+    Returns the cube for the current version of a RetailFile, or None if
+    the cube is disabled or wasn't built for this version.
+    """
+    if not settings.RETAIL_CUBE_ENABLED:
+        return None
+    cube_path = get_cube_path(retail_file)
+    if not os.path.exists(cube_path) or os.path.getmtime(cube_path) < os.path.getmtime(retail_file.file.path):
+        return None
+
+    key = (retail_file.id, get_dataset_version(retail_file))
+    with _cube_cache_lock:
+        cube = _cube_cache.get(key)
+        if cube is not None:
+            _cube_cache.move_to_end(key)
+            return cube
+
+    cube = pd.read_parquet(cube_path)
+    with _cube_cache_lock:
+        _cube_cache[key] = cube
+        while len(_cube_cache) > CUBE_CACHE_SIZE:
+            _cube_cache.popitem(last=False)
+    return cube
+
+
+def read_sidecar(sidecar_path, columns=None):
+    """
+    Reads (some columns of) a sidecar.
+    Arrow IPC sidecars are memory-mapped: numeric columns and the codes of
+    categorical ones point straight at the mapped file (read-only). Text
+    columns that didn't become categoricals are converted to Python strings,
+    so they are copied into the worker's own memory.
+    """
+    if not sidecar_path.endswith(SIDECAR_EXTENSIONS['mmap']):
+        return pd.read_parquet(sidecar_path, columns=columns)
+
+    source = pa.memory_map(sidecar_path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    if table.num_columns == 0:
+        # Keep the row count for an empty projection (e.g. a plain count)
+        return pd.DataFrame(index=pd.RangeIndex(table.num_rows))
+    return table.to_pandas(split_blocks=True)
+
+
+def build_sidecar(retail_file):
+    """
+    Streams the raw upload into its sidecar with compact dtypes:
+    - integers are downcast to the smallest integer type that fits
+    - floats become float32, but only if no value changes
+      (aggregations widen them back to float64, see as_float64)
+    - date-like text is parsed into datetimes
+    - text with many repeated values (City, Brand, ...) becomes a categorical
+    Returns the schema ({column: dtype}) and a report of the memory saved.
+    """
+    file_path = retail_file.file.path
+
+    # Pass 1: profile every column across all batches
+    profiles = {}
+    memory_before = 0
+    rows = 0
+    for chunk in iter_raw_chunks(file_path):
+        for col in chunk.columns:
+            profiles.setdefault(col, _ColumnProfile(col)).update(chunk[col])
+        memory_before += int(chunk.memory_usage(deep=True, index=False).sum())
+        rows += len(chunk)
+
+    for profile in profiles.values():
+        profile.date_format = profile.get_date_format()
+
+    # Pass 2: convert each batch and append it to the sidecar (and the cube)
+    parse_dtypes = {col: profile.parse_dtype() for col, profile in profiles.items()}
+    cube_builder = _get_cube_builder(profiles)
+    memory_after = 0
+    writer = _SidecarWriter(get_sidecar_path(retail_file))
+    try:
+        for chunk in iter_raw_chunks(file_path, dtype=parse_dtypes):
+            chunk = _convert_chunk(chunk, profiles)
+            memory_after += int(chunk.memory_usage(deep=True, index=False).sum())
+            writer.write(chunk)
+            if cube_builder:
+                cube_builder.add(chunk)
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+    cube_report = None
+    if cube_builder:
+        cube = cube_builder.result()
+        _write_cube(cube, get_cube_path(retail_file))
+        cube_report = {
+            "dimensions": cube_builder.dimensions,
+            "measures": cube_builder.measures,
+            "rows": len(cube),
+        }
+        print(f"Built cube for RetailFile {retail_file.id}: {len(cube)} cells over {cube_builder.dimensions}")
+
+    schema = {col: str(profile.final_dtype()) for col, profile in profiles.items()}
+    # CategoricalDtype prints its categories, the schema only needs the type
+    schema = {col: 'category' if dtype.startswith('category') else dtype for col, dtype in schema.items()}
+    converted = {
+        col: f"{'/'.join(sorted(profiles[col].raw_dtypes))} -> {dtype}"
+        for col, dtype in schema.items()
+        if profiles[col].raw_dtypes != {dtype}
+    }
+    report = {
+        "rows": rows,
+        "memory_before": memory_before,
+        "memory_after": memory_after,
+        "memory_saved": memory_before - memory_after,
+        "converted_columns": converted,
+        "cube": cube_report,
+    }
+    print(f"Built sidecar for RetailFile {retail_file.id} ({rows} rows): {memory_before:,} -> {memory_after:,} bytes")
+    return schema, report
+
+
+def ingest_retail_file(retail_file):
+    """
+    Upload-time ingest: builds the sidecar and saves the optimised schema
+    (e.g. {'CustomerCity': 'category'}) and the memory report on the RetailFile.
+    """
+    schema, report = build_sidecar(retail_file)
+    retail_file.schema_json = schema
+    retail_file.ingest_stats = report
+    retail_file.save()
+    return schema
+
+
+def delete_sidecar(retail_file):
+    """
+    Removes the sidecar when its RetailFile is deleted.
+    """
+    dataframe_cache.invalidate(retail_file.id)
+    for extension in list(SIDECAR_EXTENSIONS.values()) + [CUBE_EXTENSION]:
+        sidecar_path = retail_file.file.path + extension
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+
+
+def resolve_columns(retail_file, column_names):
+    """
+    Maps (case-insensitive) column names to the real names in the file's schema.
+    Unknown names are dropped here; the executors report them to the user.
+    """
+    schema = retail_file.schema_json or {}
+    available_columns = {col.lower(): col for col in schema} # {lower: RealCase}
+
+    resolved = []
+    for col_name in column_names:
+        if not col_name:
+            continue
+        real_col = available_columns.get(str(col_name).lower())
+        if real_col and real_col not in resolved:
+            resolved.append(real_col)
+    return resolved
+
+
+def read_dataframe(retail_file, columns=None):
+    """
+    Reads columns straight from disk (the sidecar, or the raw file if needed).
+    Use load_retail_dataframe() instead, which goes through the cache.
+    """
+    try:
+        if not is_sidecar_fresh(retail_file):
+            print(f"Sidecar missing or stale for RetailFile {retail_file.id}, rebuilding...")
+            build_sidecar(retail_file)
+        return read_sidecar(get_sidecar_path(retail_file), columns=columns)
+    except Exception as e:
+        print(f"Error reading sidecar for RetailFile {retail_file.id}: {e}")
+        return read_raw_file(retail_file.file.path, columns=columns)
+
+
+def read_sample(retail_file, rows):
+    """
+    The first 'rows' rows of every column, read from the start of the
+    sidecar without loading (or caching) the whole file. For looking at
+    what a file's values are like, e.g. the forecast column detector.
+    """
+    try:
+        if not is_sidecar_fresh(retail_file):
+            print(f"Sidecar missing or stale for RetailFile {retail_file.id}, rebuilding...")
+            build_sidecar(retail_file)
+        sidecar_path = get_sidecar_path(retail_file)
+        if sidecar_path.endswith(SIDECAR_EXTENSIONS['mmap']):
+            reader = pa.ipc.open_file(pa.memory_map(sidecar_path, 'r'))
+            schema = reader.schema
+            all_batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            parquet_file = pq.ParquetFile(sidecar_path)
+            schema = parquet_file.schema_arrow
+            all_batches = parquet_file.iter_batches(batch_size=rows) # At most one row group each
+        batches = []
+        for batch in all_batches:
+            batches.append(batch)
+            if sum(part.num_rows for part in batches) >= rows:
+                break
+        return pa.Table.from_batches(batches, schema=schema).slice(0, rows).to_pandas()
+    except Exception as e:
+        print(f"Error reading sidecar for RetailFile {retail_file.id}: {e}")
+        file_path = retail_file.file.path
+        if file_path.endswith('.csv'):
+            return pd.read_csv(file_path, nrows=rows)
+        return pd.read_excel(file_path, nrows=rows)
+
+
+def load_retail_dataframe(retail_file, columns=None):
+    """
+    Main function. Returns the RetailFile's data as a DataFrame.
+
+    'columns' is an optional list of column names (any case). When given,
+    only those columns are read from the sidecar (column projection).
+    Frames come from the process-wide cache whenever possible; only the
+    columns that aren't cached yet are read from disk.
+    """
+    if columns is not None:
+        columns = resolve_columns(retail_file, columns)
+
+    key = (retail_file.id, get_dataset_version(retail_file))
+    df = dataframe_cache.get(key, columns)
+    if df is not None:
+        return df
+
+    if columns is None:
+        df = read_dataframe(retail_file)
+        dataframe_cache.put(key, df, complete=True)
+        return df
+
+    cached_columns = dataframe_cache.cached_columns(key)
+    missing_columns = [col for col in columns if col not in cached_columns]
+    new_df = read_dataframe(retail_file, columns=missing_columns)
+    dataframe_cache.put(key, new_df)
+
+    df = dataframe_cache.get(key, columns, count=False)
+    if df is not None:
+        return df
+
+    # Too big for the cache budget (or adding it evicted the entry): use the
+    # columns just read, plus whatever the cache still has of the others
+    other_columns = [col for col in columns if col not in new_df.columns]
+    if not other_columns:
+        return new_df
+    other_df = dataframe_cache.get(key, other_columns, count=False)
+    if other_df is None:
+        other_df = read_dataframe(retail_file, columns=other_columns)
+    return pd.DataFrame(
+        {col: (new_df[col] if col in new_df.columns else other_df[col]) for col in columns},
+        index=new_df.index, copy=False,
+    )
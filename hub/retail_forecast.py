@@ -0,0 +1,305 @@
+import pandas as pd
+import numpy as np
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+import multiprocessing
+import warnings
+import time
+
+# --- SARIMA FITTING (no Django imports) ---
+# Kept free of Django so that process-pool workers can import it without
+# setting up the app (see run_segmented_forecast in ai_simulator.py).
+
+warnings.simplefilter('ignore', ConvergenceWarning)
+
+MIN_MONTHS = 24 # Two full seasons
+FORECAST_STEPS = 12
+SEASON_LENGTH = 12
+
+# The order search: candidate (order, seasonal_order) pairs, and the
+# rolling-origin cross-validation used to score them
+ORDER_CANDIDATES = [
+    ((p, 1, q), (sp, 1, sq, SEASON_LENGTH))
+    for p in (0, 1, 2) for q in (0, 1, 2)
+    for sp, sq in ((0, 0), (1, 0), (0, 1), (1, 1))
+]
+CV_FOLDS = 3
+CV_HORIZON = 6
+
+# The what-if scenario simulator
+SCENARIO_PATHS = 10000
+SCENARIO_PERCENTILES = (5, 25, 50, 75, 95)
+CI_Z = 1.96 # The forecasts' confidence intervals are 95%
+
+# The fast forecaster: a smoothing-parameter grid, searched all at once
+FAST_MIN_MONTHS = 3
+FAST_PARAM_GRID = np.linspace(0.05, 0.95, 10)
+
+
+def _send_result(connection, func, args):
+    """
+    Runs in the child process of run_with_deadline.
+    """
+    try:
+        connection.send(("ok", func(*args)))
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+def run_with_deadline(func, args, timeout):
+    """
+    Runs func(*args) in a child process and returns its result. Raises
+    TimeoutError after 'timeout' seconds, and the child is killed: a thread
+    can't be stopped, so a slow fit would keep using a CPU long after we
+    stopped waiting for it.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_send_result, args=(sender, func, args), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise TimeoutError(f"Didn't finish within {timeout:.1f}s")
+        status, result = receiver.recv()
+    except EOFError:
+        raise RuntimeError("The fit process died (e.g. out of memory).")
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+    if status == "error":
+        raise RuntimeError(result)
+    return result
+
+
+def get_model_order(order, seasonal_order):
+    """
+    The model order as text, e.g. '(1, 1, 1)x(1, 1, 0, 12)'.
+    """
+    return f"{tuple(order)}x{tuple(seasonal_order)}"
+
+
+def get_start_params(model: SARIMAX, saved_params: dict):
+    """
+    The saved parameters {name: value} of an earlier fit, in the model's
+    order, or None if they don't belong to this model (e.g. another order).
+    """
+    if not saved_params or list(saved_params) != list(model.param_names):
+        return None
+    return [saved_params[name] for name in model.param_names]
+
+
+def fit_sarima_forecast(monthly_sales: pd.Series, order, seasonal_order, saved_params: dict = None):
+    """
+    Fits SARIMA on a monthly series and returns the 12-month forecast in the
+    forecast page's format (without the AI summary), plus a "model" entry.
+    'saved_params' (the "params" of an earlier fit of the same order, e.g.
+    before a new month was added) warm-start the optimiser, which then
+    needs only a few iterations instead of a cold fit.
+    """
+    model = SARIMAX(monthly_sales,
+                    order=order,
+                    seasonal_order=seasonal_order,
+                    enforce_stationarity=False,
+                    enforce_invertibility=False)
+    
+    start_params = get_start_params(model, saved_params)
+    fit_start = time.perf_counter()
+    results = model.fit(start_params=start_params, disp=False)
+    fit_seconds = time.perf_counter() - fit_start
+
+    forecast = results.get_forecast(steps=FORECAST_STEPS)
+    predicted_mean = forecast.predicted_mean
+    confidence_intervals = forecast.conf_int(alpha=0.05)
+    
+    return {
+        "historical_labels": list(monthly_sales.index.strftime('%Y-%m')),
+        "historical_values": [float(v) for v in monthly_sales.values],
+        "forecast_labels": list(predicted_mean.index.strftime('%Y-%m')),
+        "forecast_values": [float(v) for v in predicted_mean.values],
+        "lower_ci": [float(v) for v in confidence_intervals.iloc[:, 0]],
+        "upper_ci": [float(v) for v in confidence_intervals.iloc[:, 1]],
+        "model": {
+            "name": "sarima",
+            "order": get_model_order(order, seasonal_order),
+            "params": {name: float(value) for name, value in results.params.items()},
+            "warm_start": start_params is not None,
+            "fit_seconds": round(fit_seconds, 3),
+            "iterations": (results.mle_retvals or {}).get("iterations"),
+        },
+    }
+
+
+def cross_validate_order(monthly_sales: pd.Series, order, seasonal_order, folds=CV_FOLDS, horizon=CV_HORIZON):
+    """
+    Rolling-origin cross-validation of one candidate order (runs in a
+    worker process): fit on the first months, forecast the next 'horizon'
+    months, move the origin forward, and repeat. Returns the mean absolute
+    out-of-sample error, or an "error" if the order can't be fitted.
+    """
+    start = time.perf_counter()
+    result = {"order": list(order), "seasonal_order": list(seasonal_order)}
+    try:
+        y = monthly_sales.to_numpy(dtype=np.float64)
+        # Each training window must still be long enough for SARIMA
+        folds = min(folds, (len(y) - MIN_MONTHS) // horizon)
+        if folds < 1:
+            raise ValueError(f"Not enough data: need at least {MIN_MONTHS + horizon} months to cross-validate.")
+
+        errors = []
+        for fold in range(folds, 0, -1):
+            train_end = len(y) - fold * horizon
+            model = SARIMAX(y[:train_end],
+                            order=order,
+                            seasonal_order=seasonal_order,
+                            enforce_stationarity=False,
+                            enforce_invertibility=False)
+            forecast = model.fit(disp=False).forecast(steps=horizon)
+            errors.append(np.abs(y[train_end:train_end + horizon] - forecast).mean())
+        result["cv_error"] = float(np.mean(errors))
+        if not np.isfinite(result["cv_error"]):
+            raise ValueError("The model's forecasts were not finite.")
+    except Exception as e:
+        result.pop("cv_error", None)
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def fit_holt_winters_forecast(monthly_sales: pd.Series, steps=FORECAST_STEPS):
+    """
+    The fast forecaster: additive Holt-Winters (or Holt's linear trend when
+    there are fewer than two seasons of data). Instead of an optimiser, every
+    (alpha, beta, gamma) of FAST_PARAM_GRID is run at once as NumPy arrays,
+    and the one with the smallest one-step-ahead error wins. Takes a few
+    milliseconds, and returns the same format as fit_sarima_forecast.
+    """
+    fit_start = time.perf_counter()
+    y = monthly_sales.to_numpy(dtype=np.float64)
+    n = len(y)
+    m = SEASON_LENGTH
+    seasonal = n >= 2 * m
+
+    grid = FAST_PARAM_GRID
+    if seasonal:
+        alpha, beta, gamma = (a.ravel() for a in np.meshgrid(grid, grid, grid, indexing='ij'))
+        level = np.full(len(alpha), y[:m].mean())
+        trend = np.full(len(alpha), (y[m:2 * m].mean() - y[:m].mean()) / m)
+        season = np.tile(y[:m] - y[:m].mean(), (len(alpha), 1))
+    else:
+        alpha, beta = (a.ravel() for a in np.meshgrid(grid, grid, indexing='ij'))
+        gamma = np.zeros(len(alpha))
+        level = np.full(len(alpha), y[0])
+        trend = np.full(len(alpha), y[1] - y[0] if n > 1 else 0.0)
+        season = np.zeros((len(alpha), m))
+
+    # One pass over time, all parameter sets side by side
+    sse = np.zeros(len(alpha))
+    for t in range(n):
+        s = season[:, t % m]
+        error = y[t] - (level + trend + s)
+        sse += error ** 2
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season[:, t % m] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+
+    best = int(np.argmin(sse))
+    horizon = np.arange(1, steps + 1)
+    forecast_values = level[best] + horizon * trend[best] + season[best, (n + horizon - 1) % m]
+    # The one-step error, widening with the horizon
+    margin = 1.96 * np.sqrt(sse[best] / n) * np.sqrt(horizon)
+    forecast_index = pd.DatetimeIndex([monthly_sales.index[-1] + pd.offsets.MonthEnd(h) for h in horizon])
+
+    return {
+        "historical_labels": list(monthly_sales.index.strftime('%Y-%m')),
+        "historical_values": [float(v) for v in y],
+        "forecast_labels": list(forecast_index.strftime('%Y-%m')),
+        "forecast_values": [float(v) for v in forecast_values],
+        "lower_ci": [float(v) for v in forecast_values - margin],
+        "upper_ci": [float(v) for v in forecast_values + margin],
+        "model": {
+            "name": "holt_winters" if seasonal else "holt",
+            "order": "additive Holt-Winters" if seasonal else "Holt linear trend",
+            "params": {"alpha": float(alpha[best]), "beta": float(beta[best]), "gamma": float(gamma[best])},
+            "warm_start": False,
+            "fit_seconds": round(time.perf_counter() - fit_start, 3),
+            "iterations": len(alpha), # Parameter sets tried
+        },
+    }
+
+
+def forecast_segment(segment, monthly_sales: pd.Series, order, seasonal_order):
+    """
+    One segment of a segmented forecast (runs in a worker process).
+    Never raises: a failed segment comes back with an "error" instead.
+    """
+    start = time.perf_counter()
+    try:
+        if len(monthly_sales) < MIN_MONTHS:
+            raise ValueError(f"Not enough data: need at least {MIN_MONTHS} months, found only {len(monthly_sales)}.")
+        result = fit_sarima_forecast(monthly_sales, order, seasonal_order)
+    except Exception as e:
+        result = {"error": str(e)}
+    result["segment"] = segment
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def simulate_scenarios(forecast_data: dict, paths=SCENARIO_PATHS, price_change_pct=0.0, price_elasticity=-1.0,
+                       promo_months=(), promo_uplift_pct=10.0, growth_override_pct=None, seed=None):
+    """
+    Monte Carlo what-if simulation on top of a forecast (the forecast page's
+    dict). All 'paths' sample paths are drawn in one NumPy operation: each
+    month adds a random shock sized so that month's spread matches the
+    model's confidence interval, so the paths wander like the real series.
+    The user's scenario is then applied to every path:
+    - price_change_pct: sales value moves by (1 + p) * (1 + elasticity * p)
+    - promo_months: months (1-12) that get promo_uplift_pct more sales
+    - growth_override_pct: replaces the model's trend with this yearly
+      growth over the same month last year
+    Returns the P5..P95 bands per month and for the 12-month total.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    mean = np.asarray(forecast_data["forecast_values"], dtype=np.float64)
+    steps = len(mean)
+
+    if growth_override_pct is not None:
+        history = np.asarray(forecast_data["historical_values"], dtype=np.float64)
+        growth = 1 + growth_override_pct / 100
+        if len(history) >= SEASON_LENGTH:
+            # Same month last year (or the year before, for month 13+), grown
+            last_year = history[len(history) - SEASON_LENGTH + np.arange(steps) % SEASON_LENGTH]
+            mean = last_year * growth ** (1 + np.arange(steps) // SEASON_LENGTH)
+        else:
+            mean = history[-1] * growth ** (np.arange(1, steps + 1) / SEASON_LENGTH)
+
+    # Spread of each month from the confidence interval, then the part of it
+    # that is new that month (so the cumulative sum has the right spread)
+    sd = (np.asarray(forecast_data["upper_ci"]) - np.asarray(forecast_data["lower_ci"])) / (2 * CI_Z)
+    variance = np.maximum.accumulate(np.maximum(sd, 0) ** 2)
+    step_sd = np.sqrt(np.diff(variance, prepend=0.0))
+    samples = mean + np.cumsum(rng.standard_normal((paths, steps)) * step_sd, axis=1)
+
+    # The user's shocks, as one multiplier per month
+    multiplier = np.full(steps, 1.0)
+    price_change = price_change_pct / 100
+    multiplier *= (1 + price_change) * (1 + price_elasticity * price_change)
+    forecast_months = np.array([int(label[-2:]) for label in forecast_data["forecast_labels"]])
+    multiplier[np.isin(forecast_months, list(promo_months))] *= 1 + promo_uplift_pct / 100
+    samples = np.maximum(samples * multiplier, 0) # Sales can't go below zero
+
+    bands = np.percentile(samples, SCENARIO_PERCENTILES, axis=0)
+    totals = np.percentile(samples.sum(axis=1), SCENARIO_PERCENTILES)
+    return {
+        "labels": list(forecast_data["forecast_labels"]),
+        "bands": {f"p{p}": [float(v) for v in band] for p, band in zip(SCENARIO_PERCENTILES, bands)},
+        "mean": [float(v) for v in samples.mean(axis=0)],
+        "total": {f"p{p}": float(v) for p, v in zip(SCENARIO_PERCENTILES, totals)},
+        "paths": paths,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
@@ -0,0 +1,140 @@
+import pandas as pd
+import numpy as np
+import threading
+import sys
+
+# --- INVERTED VALUE INDEX FOR CHAT FILTERS ---
+# Chat filters are case-insensitive equality checks ("CustomerCity = chennai").
+# Instead of lower-casing a whole column on every question, we build, once
+# per dataset and column:
+#   - one integer code per row (which distinct value the row holds)
+#   - a map {normalised value: codes} (e.g. {'chennai': [3]})
+#   - the row positions of every code, grouped together
+# A filter is then a dictionary lookup, and combining filters only touches
+# the rows that are still left.
+
+
+def normalize_value(value):
+    """
+    The filter key for a value: its text, lower-cased.
+    (This is what the old astype(str).str.lower() comparison used.)
+    """
+    return str(value).lower()
+
+
+class ColumnIndex:
+    """
+    The inverted index of a single column.
+    """
+    def __init__(self, series: pd.Series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Categoricals already have their codes, no need to factorize
+            codes = series.cat.codes.to_numpy().astype(np.int32)
+            labels = list(series.cat.categories.astype(str))
+        else:
+            codes, uniques = pd.factorize(series)
+            codes = codes.astype(np.int32)
+            # Converting the uniques as a Series gives exactly the text that
+            # the whole column would give (e.g. dates without '00:00:00')
+            labels = list(pd.Series(uniques, dtype=series.dtype).astype(str))
+
+        missing = np.flatnonzero(codes == -1)
+        if len(missing):
+            # Empty cells get their own code, labelled like astype(str) shows them ('nan', 'None', 'NaT')
+            codes[missing] = len(labels)
+            labels.append(series.iloc[missing[:1]].astype(str).iloc[0])
+
+        self.codes = codes
+        self.keys = {} # {normalised value: [codes]}
+        for code, label in enumerate(labels):
+            self.keys.setdefault(label.lower(), []).append(code)
+        # One Python string and list per distinct value: for an OrderID or
+        # CustomerName column this is most of the index
+        self.keys_nbytes = sys.getsizeof(self.keys) + sum(
+            sys.getsizeof(key) + sys.getsizeof(key_codes) + sum(sys.getsizeof(code) for code in key_codes)
+            for key, key_codes in self.keys.items()
+        )
+
+        counts = np.bincount(codes, minlength=len(labels))
+        self.counts = counts
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # A stable sort keeps the positions of each code in row order
+        position_dtype = np.int32 if len(codes) < 2**31 else np.int64
+        self.order = np.argsort(codes, kind='stable').astype(position_dtype)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.order.nbytes + self.offsets.nbytes + self.counts.nbytes + self.keys_nbytes
+
+    def lookup(self, value):
+        """
+        The codes whose value matches 'value' (case-insensitive).
+        """
+        return self.keys.get(normalize_value(value), [])
+
+    def count(self, codes):
+        return int(sum(self.counts[code] for code in codes))
+
+    def positions(self, codes):
+        """
+        The (sorted) row positions holding any of 'codes'.
+        """
+        parts = [self.order[self.offsets[code]:self.offsets[code + 1]] for code in codes]
+        if not parts:
+            return np.empty(0, dtype=self.order.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+    def keep(self, positions, codes):
+        """
+        The subset of 'positions' whose row holds any of 'codes'.
+        """
+        row_codes = self.codes[positions]
+        if len(codes) == 1:
+            return positions[row_codes == codes[0]]
+        return positions[np.isin(row_codes, codes)]
+
+
+class ValueIndex:
+    """
+    The column indexes of one dataset version, built lazily (the first time
+    a column is filtered on) and then reused by every later question.
+    """
+    def __init__(self):
+        self.columns = {} # {column name: ColumnIndex}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return sum(column_index.nbytes for column_index in self.columns.values())
+
+    def column(self, col_name, series: pd.Series):
+        with self._lock:
+            column_index = self.columns.get(col_name)
+            if column_index is None:
+                column_index = ColumnIndex(series)
+                self.columns[col_name] = column_index
+                print(f"Built value index for column '{col_name}' ({len(column_index.keys)} values)")
+            return column_index
+
+    def filter_positions(self, df: pd.DataFrame, filters):
+        """
+        Row positions that match ALL (column, value) filters.
+        The most selective filter is looked up first; the others only
+        check the rows that are still left.
+        """
+        matches = []
+        for col_name, value in filters:
+            column_index = self.column(col_name, df[col_name])
+            codes = column_index.lookup(value)
+            matches.append((column_index.count(codes), column_index, codes))
+        matches.sort(key=lambda match: match[0])
+
+        _, first_index, first_codes = matches[0]
+        positions = first_index.positions(first_codes)
+        for _, column_index, codes in matches[1:]:
+            if len(positions) == 0:
+                break
+            positions = column_index.keep(positions, codes)
+        return positions
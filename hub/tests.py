@@ -1,3 +1,429 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
+import pandas as pd
+import numpy as np
+import os
+import shutil
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+from .ai_chatter import execute_json_query, query_cache, run_cached_query
+from .ai_simulator import detect_forecast_columns
+from .chat_intent import DATA_QUERY, GREETING, classify_intent, is_tanglish
+from .chat_replies import naturalize_with_template
+from .retail_cube import CubeBuilder, execute_cube_query
+from .retail_data import build_sidecar, get_sidecar_path, read_sidecar
+from .retail_forecast import FORECAST_STEPS, SCENARIO_PERCENTILES, fit_holt_winters_forecast, simulate_scenarios
+from .retail_index import ValueIndex
 
 # Create your tests here.
+
+def make_sales_df(rows=200000):
+    """
+    A wide sales frame: a few categorical dimensions and many numeric columns,
+    so a full-frame copy is much bigger than any single column.
+    """
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'CustomerCity': pd.Categorical(rng.choice(['Chennai', 'Coimbatore', 'Madurai'], rows)),
+        'Brand': pd.Categorical(rng.choice(['Sony', 'Samsung', 'LG', 'Apple'], rows)),
+        'Total Price': rng.uniform(10, 1000, rows),
+    })
+    for i in range(10):
+        df[f'Metric{i}'] = rng.uniform(size=rows)
+    return df
+
+
+def peak_memory(func):
+    """
+    Runs func() and returns (its result, the peak bytes allocated while it ran).
+    """
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+class ExecuteJsonQueryMemoryTests(SimpleTestCase):
+    """
+    execute_json_query must combine filters into one selection and only
+    project the columns it aggregates, never copying the whole DataFrame.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = make_sales_df()
+        cls.frame_bytes = cls.df.memory_usage(deep=True).sum()
+        cls.expected_mask = ((cls.df['CustomerCity'] == 'Chennai') & (cls.df['Brand'] == 'Sony')).to_numpy()
+
+    def assert_no_frame_copy(self, peak):
+        # One float column is 1/13 of this frame; a copy of the frame would be all of it
+        self.assertLess(peak, self.frame_bytes / 4)
+
+    def test_filtered_sum_with_masks(self):
+        query = {"operation": "sum", "agg_col": "total price", "filters": [
+            {"column": "CustomerCity", "value": "chennai"},
+            {"column": "brand", "value": "SONY"},
+        ]}
+        answer, peak = peak_memory(lambda: execute_json_query(self.df, query, ""))
+
+        expected = self.df['Total Price'].to_numpy()[self.expected_mask].sum()
+        self.assertEqual(answer, f"{expected:,.2f}")
+        self.assert_no_frame_copy(peak)
+
+    def test_filtered_count_with_value_index(self):
+        query = {"operation": "count", "filters": [
+            {"column": "CustomerCity", "value": "Chennai"},
+            {"column": "Brand", "value": "Sony"},
+        ]}
+        value_index = ValueIndex()
+        execute_json_query(self.df, query, "", value_index=value_index) # Builds the index
+
+        answer, peak = peak_memory(lambda: execute_json_query(self.df, query, "", value_index=value_index))
+
+        self.assertEqual(answer, str(self.expected_mask.sum()))
+        self.assert_no_frame_copy(peak)
+
+    def test_filtered_groupby(self):
+        query = {"operation": "groupby_agg", "groupby_col": "Brand", "agg_col": "Total Price",
+                 "agg_func": "mean", "filters": [{"column": "CustomerCity", "value": "Madurai"}]}
+        answer, peak = peak_memory(lambda: execute_json_query(self.df, query, ""))
+
+        madurai = self.df[self.df['CustomerCity'] == 'Madurai']
+        expected = madurai.groupby('Brand', observed=True)['Total Price'].mean().nlargest(5)
+        self.assertEqual(answer, f"Here are the Top 5 Brand by Total Price:\n{expected.to_string()}")
+        self.assert_no_frame_copy(peak)
+
+    def test_index_and_masks_agree(self):
+        query = {"operation": "count", "filters": [
+            {"column": "customercity", "value": "COIMBATORE"},
+            {"column": "brand", "value": "lg"},
+        ]}
+        self.assertEqual(
+            execute_json_query(self.df, query, ""),
+            execute_json_query(self.df, query, "", value_index=ValueIndex()),
+        )
+
+    def test_unknown_column(self):
+        query = {"operation": "count", "filters": [{"column": "Profit", "value": "1"}]}
+        self.assertIn("couldn't find a column", execute_json_query(self.df, query, ""))
+
+
+class CubeQueryTests(SimpleTestCase):
+    """
+    A query answered from the cube must give the same answer as the same
+    query run on the raw DataFrame.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = make_sales_df(rows=20000)[['CustomerCity', 'Brand', 'Total Price']]
+        cls.df['Total Price'] = cls.df['Total Price'].astype('float32') # Like a compact sidecar column
+        cls.df['Quantity'] = np.random.default_rng(1).integers(1, 10, len(cls.df))
+        builder = CubeBuilder(['CustomerCity', 'Brand'], ['Total Price', 'Quantity'], max_dims=2)
+        for start in range(0, len(cls.df), 7000): # Built batch by batch, like at ingest
+            builder.add(cls.df.iloc[start:start + 7000])
+        cls.cube = builder.result()
+
+    def assert_same_answer(self, query):
+        answer = execute_cube_query(self.cube, query)
+        self.assertIsNotNone(answer)
+        self.assertEqual(answer, execute_json_query(self.df, query, ""))
+
+    def test_sum_and_mean(self):
+        for operation in ('sum', 'mean'):
+            for agg_col in ('Total Price', 'Quantity'):
+                with self.subTest(operation=operation, agg_col=agg_col):
+                    self.assert_same_answer({"operation": operation, "agg_col": agg_col, "filters": [
+                        {"column": "CustomerCity", "value": "chennai"},
+                        {"column": "Brand", "value": "Sony"},
+                    ]})
+
+    def test_count(self):
+        self.assert_same_answer({"operation": "count", "filters": []})
+        self.assert_same_answer({"operation": "count", "filters": [{"column": "brand", "value": "LG"}]})
+
+    def test_groupby_agg(self):
+        for agg_func in ('sum', 'mean', 'count'):
+            with self.subTest(agg_func=agg_func):
+                self.assert_same_answer({"operation": "groupby_agg", "groupby_col": "Brand",
+                                         "agg_col": "Total Price", "agg_func": agg_func,
+                                         "filters": [{"column": "CustomerCity", "value": "Madurai"}]})
+
+    def run_cached_query(self, query):
+        """
+        run_cached_query on this test's cube and frame instead of a RetailFile's.
+        """
+        query_cache.delete('cube-test')
+        with mock.patch.multiple(
+            'hub.ai_chatter',
+            get_query_cache_key=mock.Mock(return_value='cube-test'),
+            load_retail_cube=mock.Mock(return_value=self.cube),
+            load_retail_dataframe=mock.Mock(return_value=self.df),
+            get_value_index=mock.Mock(return_value=ValueIndex()),
+        ):
+            return run_cached_query(None, query, "")
+
+    def test_served_by_cube(self):
+        query = {"operation": "sum", "agg_col": "Total Price", "filters": [{"column": "Brand", "value": "LG"}]}
+        answer, served_by = self.run_cached_query(query)
+        self.assertEqual(served_by, 'cube')
+        self.assertEqual(answer, execute_json_query(self.df, query, ""))
+
+    def test_unsupported_query_falls_back(self):
+        query = {"operation": "groupby_agg", "groupby_col": "Brand", "agg_col": "Total Price",
+                 "agg_func": "idxmax", "filters": []}
+        self.assertIsNone(execute_cube_query(self.cube, query))
+
+        answer, served_by = self.run_cached_query(query)
+        self.assertNotEqual(served_by, 'cube')
+        self.assertEqual(answer, execute_json_query(self.df, query, ""))
+
+
+@override_settings(RETAIL_DATASET_STORAGE='parquet', RETAIL_CUBE_ENABLED=False)
+class IngestDtypeTests(SimpleTestCase):
+    """
+    The two-pass ingest must pick each column's dtype from ALL of its
+    batches, and convert every batch to it without losing values.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def ingest(self, csv_text, chunk_rows):
+        """
+        Returns (schema, sidecar DataFrame) for a CSV read 'chunk_rows' rows at a time.
+        """
+        path = os.path.join(self.directory, 'sales.csv')
+        with open(path, 'w') as f:
+            f.write(csv_text)
+        retail_file = SimpleNamespace(id=1, file=SimpleNamespace(path=path))
+        with override_settings(RETAIL_INGEST_CHUNK_ROWS=chunk_rows):
+            schema, _ = build_sidecar(retail_file)
+        return schema, read_sidecar(get_sidecar_path(retail_file))
+
+    def test_compact_dtypes(self):
+        schema, df = self.ingest(
+            "Qty,Price,Ratio,Paid,City,Note,OrderDate\n"
+            "1,2.5,0.1,True,Chennai,a,2023-01-05\n"
+            "2,3.5,0.2,False,Chennai,b,2023-02-05\n"
+            "3,4.5,0.3,True,Madurai,c,2023-03-05\n"
+            "400,5.5,0.4,False,Madurai,d,2023-04-05\n",
+            chunk_rows=2,
+        )
+        self.assertEqual(schema, {
+            'Qty': 'int16', 'Price': 'float32', 'Ratio': 'float64', 'Paid': 'bool',
+            'City': 'category', 'Note': 'object', 'OrderDate': 'datetime64[ns]',
+        })
+        self.assertEqual(df['Qty'].tolist(), [1, 2, 3, 400])
+        self.assertEqual(df['Ratio'].tolist(), [0.1, 0.2, 0.3, 0.4]) # 0.1 isn't exact in float32
+        self.assertEqual(df['OrderDate'].dt.month.tolist(), [1, 2, 3, 4])
+
+    def test_mixed_batches(self):
+        schema, df = self.ingest(
+            "Amount,Code\n"
+            "1,1\n2,2\n"    # int, int
+            "2.5,x\n3,y\n", # float, text
+            chunk_rows=2,
+        )
+        self.assertEqual(schema, {'Amount': 'float32', 'Code': 'object'})
+        self.assertEqual(df['Amount'].tolist(), [1.0, 2.0, 2.5, 3.0])
+        self.assertEqual(df['Code'].tolist(), ['1', '2', 'x', 'y'])
+
+    def test_empty_cells(self):
+        schema, df = self.ingest(
+            "Qty,Flag\n"
+            "1,True\n2,False\n"
+            ",True\n,\n" # Qty is empty in this whole batch
+            "5,False\n",
+            chunk_rows=2,
+        )
+        self.assertEqual(schema, {'Qty': 'float64', 'Flag': 'boolean'})
+        self.assertEqual(df['Qty'].isna().tolist(), [False, False, True, True, False])
+        self.assertEqual(df['Flag'].isna().tolist(), [False, False, False, True, False])
+        self.assertEqual(df['Flag'].dropna().tolist(), [True, False, True, False])
+
+    def test_day_first_dates(self):
+        # The first batch is ambiguous on its own; the second is only valid day-first
+        schema, df = self.ingest(
+            "OrderDate\n05/02/2023\n06/02/2023\n25/02/2023\n26/03/2023\n",
+            chunk_rows=2,
+        )
+        self.assertEqual(schema, {'OrderDate': 'datetime64[ns]'})
+        self.assertEqual(df['OrderDate'].dt.month.tolist(), [2, 2, 2, 3])
+        self.assertEqual(df['OrderDate'].dt.day.tolist(), [5, 6, 25, 26])
+
+    def test_date_threshold(self):
+        dates = "".join(f"2023-01-{day:02d}\n" for day in range(1, 10))
+        # 9 of 10 values parse: still a date column, the bad one becomes empty
+        schema, df = self.ingest(f"OrderDate\n{dates}unknown\n", chunk_rows=10)
+        self.assertEqual(schema, {'OrderDate': 'datetime64[ns]'})
+        self.assertEqual(df['OrderDate'].isna().sum(), 1)
+
+        # 9 of 11 don't: kept as text
+        schema, df = self.ingest(f"OrderDate\n{dates}unknown\nlater\n", chunk_rows=11)
+        self.assertEqual(schema, {'OrderDate': 'object'})
+        self.assertEqual(df['OrderDate'].iloc[-1], 'later')
+
+
+class ChatIntentTests(SimpleTestCase):
+    columns = ['CustomerCity', 'Brand', 'Total Price']
+
+    def test_greetings(self):
+        for message in ('hi', 'thanks a lot!', 'vanakkam', 'vanakam nanba'): # The last one misspelt
+            with self.subTest(message=message):
+                intent, confidence = classify_intent(message, self.columns)
+                self.assertEqual(intent, GREETING)
+                self.assertGreaterEqual(confidence, 0.7)
+
+    def test_data_queries(self):
+        for message in ('total sales in Chennai?', 'ethana per UPI use pannirukanga?', 'which brand has the highest total price'):
+            with self.subTest(message=message):
+                intent, confidence = classify_intent(message, self.columns)
+                self.assertEqual(intent, DATA_QUERY)
+                self.assertGreaterEqual(confidence, 0.7)
+
+    def test_unclear_message(self):
+        self.assertEqual(classify_intent('asdf qwer', self.columns), (None, 0.0))
+        self.assertEqual(classify_intent('???', self.columns), (None, 0.0))
+
+    def test_is_tanglish(self):
+        self.assertTrue(is_tanglish('Chennai la evlo sales?'))
+        self.assertTrue(is_tanglish('ethana per UPI use pannirukanga?'))
+        self.assertFalse(is_tanglish('la la land sales total'))
+        self.assertFalse(is_tanglish('sales in LA'))
+
+
+class TemplateNaturalizerTests(SimpleTestCase):
+    chennai = [{"column": "CustomerCity", "value": "Chennai"}]
+
+    def test_english(self):
+        count = {"operation": "count", "filters": self.chennai}
+        self.assertEqual(naturalize_with_template("how many customers in Chennai?", count, "42"),
+                         "There are 42 customers where CustomerCity is Chennai.")
+        mean = {"operation": "mean", "agg_col": "Total Price", "filters": []}
+        self.assertEqual(naturalize_with_template("average price", mean, "5.00"), "The average Total Price is 5.00.")
+        total = {"operation": "sum", "agg_col": "Total Price", "filters": self.chennai}
+        self.assertEqual(naturalize_with_template("sales in LA", total, "1.00"), # Not Tanglish
+                         "The Total Price where CustomerCity is Chennai is 1.00.")
+
+    def test_tanglish(self):
+        total = {"operation": "sum", "agg_col": "Total Price", "filters": self.chennai}
+        self.assertEqual(naturalize_with_template("Chennai la motham sales evlo?", total, "1,234.00"),
+                         "Chennai-la Total Price motham: 1,234.00.")
+
+    def test_groupby(self):
+        top = {"operation": "groupby_agg", "groupby_col": "Brand", "agg_col": "Total Price", "agg_func": "sum", "filters": []}
+        answer = naturalize_with_template("top brands", top, "Here are the Top 5 Brand by Total Price:\nBrand\nSony  10")
+        self.assertEqual(answer, "Here are the Top 5 Brand by total Total Price:\nBrand\nSony  10")
+        best = dict(top, agg_func="idxmax")
+        self.assertEqual(naturalize_with_template("best brand", best, "Sony"), "The Brand with the highest Total Price is Sony.")
+
+    def test_unknown_operation(self):
+        self.assertEqual(naturalize_with_template("hi", {"operation": "pivot"}, "raw answer"), "raw answer")
+
+
+def make_monthly_sales(months=48):
+    """
+    A seasonal monthly series with a trend, peaking every December.
+    """
+    index = pd.date_range('2020-01-31', periods=months, freq='M')
+    season = 100 * np.cos(2 * np.pi * (index.month - 12) / 12)
+    noise = np.random.default_rng(0).normal(0, 10, months)
+    return pd.Series(1000 + 5 * np.arange(months) + season + noise, index=index)
+
+
+class HoltWintersForecastTests(SimpleTestCase):
+    def test_seasonal_forecast(self):
+        forecast = fit_holt_winters_forecast(make_monthly_sales())
+
+        self.assertEqual(forecast["model"]["name"], 'holt_winters')
+        self.assertEqual(len(forecast["forecast_values"]), FORECAST_STEPS)
+        self.assertEqual(forecast["forecast_labels"][:2], ['2024-01', '2024-02'])
+        values = np.array(forecast["forecast_values"])
+        self.assertTrue((np.array(forecast["lower_ci"]) <= values).all())
+        self.assertTrue((values <= np.array(forecast["upper_ci"])).all())
+        # The season carries on: the peak is in December again
+        self.assertEqual(forecast["forecast_labels"][values.argmax()], '2024-12')
+
+    def test_short_history(self):
+        # Less than two seasons: Holt's linear trend, still a full year ahead
+        forecast = fit_holt_winters_forecast(make_monthly_sales(months=15))
+        self.assertEqual(len(forecast["forecast_values"]), FORECAST_STEPS)
+        self.assertTrue((np.array(forecast["lower_ci"]) <= np.array(forecast["upper_ci"])).all())
+
+
+class ScenarioSimulationTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.forecast = fit_holt_winters_forecast(make_monthly_sales())
+
+    def simulate(self, **scenario):
+        return simulate_scenarios(self.forecast, paths=2000, seed=1, **scenario)
+
+    def test_percentiles_are_ordered(self):
+        scenario = self.simulate()
+        bands = np.array([scenario["bands"][f"p{p}"] for p in SCENARIO_PERCENTILES])
+        self.assertTrue((np.diff(bands, axis=0) >= 0).all())
+        totals = [scenario["total"][f"p{p}"] for p in SCENARIO_PERCENTILES]
+        self.assertEqual(totals, sorted(totals))
+        # The median path follows the forecast
+        np.testing.assert_allclose(scenario["bands"]["p50"], self.forecast["forecast_values"], rtol=0.05)
+
+    def test_price_change_scales_every_path(self):
+        base = self.simulate()
+        # -10% price with elasticity -2: (1 - 0.1) * (1 + 0.2) = 1.08x the sales value
+        cheaper = self.simulate(price_change_pct=-10, price_elasticity=-2)
+        for p in SCENARIO_PERCENTILES:
+            self.assertAlmostEqual(cheaper["total"][f"p{p}"] / base["total"][f"p{p}"], 1.08, places=6)
+
+    def test_promo_months(self):
+        base = self.simulate()
+        promo = self.simulate(promo_months=[12], promo_uplift_pct=20)
+        december = promo["labels"].index('2024-12')
+        for month in range(FORECAST_STEPS):
+            ratio = promo["bands"]["p50"][month] / base["bands"]["p50"][month]
+            self.assertAlmostEqual(ratio, 1.2 if month == december else 1.0, places=6)
+
+
+class ForecastColumnDetectorTests(SimpleTestCase):
+    """
+    The detector goes by the values, not the column names.
+    """
+    rows = 500
+
+    def test_month_and_year_columns(self):
+        rng = np.random.default_rng(0)
+        months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+                  'August', 'September', 'October', 'November', 'December']
+        df = pd.DataFrame({
+            'Ref': np.arange(1000, 1000 + self.rows), # Increasing ints, but not years
+            'Col_A': rng.choice(months, self.rows),
+            'Col_B': rng.choice([2021, 2022, 2023], self.rows),
+            'Col_C': rng.uniform(10, 900, self.rows).round(2),
+            'Units': rng.integers(1, 5, self.rows),
+            'Store': rng.choice(['North', 'South'], self.rows),
+        })
+        columns = detect_forecast_columns(df)
+        self.assertEqual((columns["month_col"], columns["year_col"], columns["sales_col"]), ('Col_A', 'Col_B', 'Col_C'))
+        self.assertGreater(columns["confidence"], 0)
+
+    def test_date_column(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'Stamp': pd.date_range('2021-01-01', periods=self.rows, freq='D').strftime('%Y-%m-%d'),
+            'Year': rng.integers(1, 5, self.rows), # Named like a year, but it isn't one
+            'Amt': rng.uniform(10, 900, self.rows).round(2),
+        })
+        columns = detect_forecast_columns(df)
+        self.assertEqual((columns["month_col"], columns["year_col"], columns["sales_col"]), ('Stamp', None, 'Amt'))
+
+    def test_no_time_column(self):
+        df = pd.DataFrame({'Store': ['North', 'South'] * 10, 'Amt': np.linspace(10, 100, 20)})
+        columns = detect_forecast_columns(df)
+        self.assertIsNone(columns["month_col"])
+        self.assertEqual(columns["confidence"], 0)
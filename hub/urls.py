@@ -19,9 +19,16 @@ urlpatterns = [
     path('retail/', views.retail_dashboard_view, name='retail_dashboard'), 
     path('retail/chat/<int:file_id>/', views.retail_chat_view, name='retail_chat'),
     path('retail/dashboard/<int:file_id>/', views.retail_auto_dashboard_view, name='retail_auto_dashboard'),
+    path('retail/dashboard/<int:file_id>/regenerate/', views.retail_dashboard_regenerate_view, name='retail_dashboard_regenerate'),
     path('retail/delete/<int:file_id>/', views.retail_delete_view, name='retail_delete'),
     
     # --- THIS IS THE NEW LINE FOR THE SIMULATION ---
     path('retail/forecast/<int:file_id>/', views.retail_forecast_view, name='retail_forecast'),
+    path('retail/forecast/<int:file_id>/scenario/', views.retail_forecast_scenario_view, name='retail_forecast_scenario'),
+    path('retail/forecast/<int:file_id>/segments/', views.retail_forecast_segments_view, name='retail_forecast_segments'),
     # --- END NEW LINE ---
+    
+    # Background jobs (status page + JSON polling)
+    path('jobs/<int:job_id>/', views.job_status_view, name='job_status'),
+    path('jobs/<int:job_id>/status/', views.job_status_json_view, name='job_status_json'),
 ]
\ No newline at end of file
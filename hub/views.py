@@ -1,4 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
@@ -8,14 +10,14 @@ from .models import (
     UploadedFile, 
     AnalysisResult,
     RetailFile,
-    ChatMessage
+    ChatMessage,
+    BackgroundJob
 )
-from .ai_analyzer import perform_analysis
 from .ai_chatter import get_ai_chat_response
-from .ai_dashboarder import get_dashboard_layout, execute_dashboard_queries
-# --- THIS IMPORT IS NOW UPDATED ---
-from .ai_simulator import get_forecast_columns, run_sales_forecast
-import pandas as pd
+from .ai_dashboarder import get_saved_dashboard_layout, get_saved_chart_data, save_chart_data, execute_dashboard_queries
+from .jobs import enqueue_job, fail_stale_jobs
+from .ai_simulator import get_saved_sales_forecast, simulate_scenarios
+from .retail_data import delete_sidecar, ingest_retail_file, load_retail_dataframe
 import json
 
 
@@ -64,8 +66,13 @@ def feedback_view(request):
             uploaded_file.user = request.user
             uploaded_file.save()
             
-            perform_analysis(uploaded_file.id)
-            return redirect('result_detail', file_id=uploaded_file.id)
+            # The Gemini analysis runs in the background job worker
+            job = enqueue_job(
+                request.user, 'perform_analysis',
+                next_url=reverse('result_detail', args=[uploaded_file.id]),
+                uploaded_file_id=uploaded_file.id,
+            )
+            return redirect('job_status', job_id=job.id)
     else:
         form = FileUploadForm()
     
@@ -109,15 +116,9 @@ def retail_dashboard_view(request):
             retail_file.save()
             
             try:
-                file_path = retail_file.file.path
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                else:
-                    df = pd.read_excel(file_path)
-                
-                schema = {col: str(df[col].dtype) for col in df.columns}
-                retail_file.schema_json = schema
-                retail_file.save()
+                # Parse the upload once, optimise its dtypes and save the
+                # columnar sidecar + schema
+                ingest_retail_file(retail_file)
             except Exception as e:
                 print(f"Error reading schema for {retail_file.id}: {e}")
             
@@ -149,12 +150,14 @@ def retail_chat_view(request, file_id):
                 is_from_user=True
             )
             
-            ai_response_text = get_ai_chat_response(retail_file, user_message)
+            details = {}
+            ai_response_text = get_ai_chat_response(retail_file, user_message, details)
             
             ChatMessage.objects.create(
                 retail_file=retail_file,
                 response=ai_response_text,
-                is_from_user=False
+                is_from_user=False,
+                served_by=details.get("served_by", '')
             )
         
         return redirect('retail_chat', file_id=file_id)
@@ -179,7 +182,16 @@ def retail_auto_dashboard_view(request, file_id):
             'error': 'File schema was not generated. Please re-upload the file.'
         })
 
-    dashboard_layout = get_dashboard_layout(retail_file.schema_json)
+    # Charts already computed for this layout and file version: one DB read
+    chart_data = get_saved_chart_data(retail_file)
+    if chart_data is not None:
+        return render(request, 'hub/retail_auto_dashboard.html', {
+            'file': retail_file,
+            'chart_data_for_template': chart_data
+        })
+
+    # Saved per schema, so only the first visit (or a regenerate) calls the AI planner
+    dashboard_layout, saved_layout = get_saved_dashboard_layout(retail_file)
     
     if "error" in dashboard_layout or "charts" not in dashboard_layout or not dashboard_layout["charts"]:
         return render(request, 'hub/retail_auto_dashboard.html', {
@@ -188,11 +200,11 @@ def retail_auto_dashboard_view(request, file_id):
         })
     
     try:
-        file_path = retail_file.file.path
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        # Only load the columns that the charts actually use
+        planned_columns = []
+        for chart_plan in dashboard_layout["charts"]:
+            planned_columns += [chart_plan.get("x_col"), chart_plan.get("y_col")]
+        df = load_retail_dataframe(retail_file, columns=planned_columns)
     except Exception as e:
         return render(request, 'hub/retail_auto_dashboard.html', {
             'file': retail_file, 
@@ -206,16 +218,36 @@ def retail_auto_dashboard_view(request, file_id):
             'file': retail_file, 
             'error': "The AI generated a plan, but the data execution failed for all charts."
         })
+    save_chart_data(retail_file, saved_layout, chart_data)
     
     return render(request, 'hub/retail_auto_dashboard.html', {
         'file': retail_file,
         'chart_data_for_template': chart_data # Pass the raw Python list
     })
 
+@require_POST
+@login_required
+def retail_dashboard_regenerate_view(request, file_id):
+    """
+    Asks the AI planner for a new dashboard layout for this file's schema.
+    """
+    retail_file = get_object_or_404(RetailFile, id=file_id, user=request.user)
+    
+    if retail_file.schema_json:
+        dashboard_layout, _ = get_saved_dashboard_layout(retail_file, regenerate=True)
+        if "error" in dashboard_layout or "charts" not in dashboard_layout or not dashboard_layout["charts"]:
+            return render(request, 'hub/retail_auto_dashboard.html', {
+                'file': retail_file, 
+                'error': f"AI Planner failed: {dashboard_layout.get('error', 'The AI did not return a valid chart plan.')}"
+            })
+    
+    return redirect('retail_auto_dashboard', file_id=file_id)
+
 @require_POST
 @login_required
 def retail_delete_view(request, file_id):
     file_to_delete = get_object_or_404(RetailFile, id=file_id, user=request.user)
+    delete_sidecar(file_to_delete)
     file_to_delete.delete()
     return redirect('retail_dashboard')
 
@@ -223,7 +255,8 @@ def retail_delete_view(request, file_id):
 @login_required
 def retail_forecast_view(request, file_id):
     """
-    This page runs the SARIMA forecast model and displays the result.
+    This page shows the SARIMA forecast. The forecast itself runs as a
+    background job; the job status page sends the user back here (?job=...).
     """
     retail_file = get_object_or_404(RetailFile, id=file_id, user=request.user)
     
@@ -234,52 +267,168 @@ def retail_forecast_view(request, file_id):
             'error': 'File schema was not generated. Please re-upload the file.'
         })
 
-    # 2. AI Call: Get the date and sales columns
-    column_names = get_forecast_columns(retail_file.schema_json)
-    
-    if "error" in column_names:
-        return render(request, 'hub/retail_forecast.html', {
-            'file': retail_file, 
-            'error': f"AI Column-Finder failed: {column_names.get('error')}"
-        })
+    # 2. Show a finished forecast job's result
+    job_id = request.GET.get('job')
+    if job_id:
+        job = get_object_or_404(BackgroundJob, id=job_id, user=request.user, task='run_sales_forecast',
+                                args_json__retail_file_id=retail_file.id)
+        if job.status == 'failed':
+            return render(request, 'hub/retail_forecast.html', {
+                'file': retail_file, 
+                'error': f"Forecast Failed: {job.error}"
+            })
+        if job.status == 'done':
+            forecast_data = job.result_json
+            if "error" in forecast_data:
+                return render(request, 'hub/retail_forecast.html', {
+                    'file': retail_file, 
+                    'error': forecast_data.get('error')
+                })
+            return render(request, 'hub/retail_forecast.html', {
+                'file': retail_file,
+                'forecast_data_for_template': forecast_data, # Pass the raw Python dict
+                'segment_columns': get_segment_columns(retail_file),
+            })
+        return redirect('job_status', job_id=job.id)
 
-    # 3. Load the data file
-    try:
-        file_path = retail_file.file.path
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-    except Exception as e:
+    # 3. A forecast already saved for this file version is just a lookup
+    forecast_data = get_saved_sales_forecast(retail_file)
+    if forecast_data is not None:
         return render(request, 'hub/retail_forecast.html', {
-            'file': retail_file, 
-            'error': f"Error loading data file: {e}"
+            'file': retail_file,
+            'forecast_data_for_template': forecast_data,
+            'segment_columns': get_segment_columns(retail_file),
         })
 
-    # 4. Run the forecast!
-    # --- THIS IS THE NEW LOGIC ---
-    sales_col = column_names.get('sales_col')
-    month_col = column_names.get('month_col')
-    year_col = column_names.get('year_col') # This can be null
-    
-    if not month_col or not sales_col:
-        return render(request, 'hub/retail_forecast.html', {
-            'file': retail_file, 
-            'error': f"AI failed to identify valid date/month or sales columns. Identified: {column_names}"
-        })
+    # 4. Otherwise queue the forecast (AI column-finder + SARIMA) for the worker,
+    # reusing a job that's already waiting or running for this file
+    fail_stale_jobs() # A job whose worker died would be waited on forever
+    job = BackgroundJob.objects.filter(
+        user=request.user, task='run_sales_forecast', args_json__retail_file_id=retail_file.id,
+        status__in=['queued', 'running'],
+    ).first()
+    if job is None:
+        job = enqueue_job(request.user, 'run_sales_forecast', retail_file_id=retail_file.id)
+        job.next_url = f"{reverse('retail_forecast', args=[retail_file.id])}?job={job.id}"
+        job.save(update_fields=['next_url'])
+    return redirect('job_status', job_id=job.id)
+
+@login_required
+def retail_forecast_scenario_view(request, file_id):
+    """
+    JSON: Monte Carlo what-if bands for the forecast shown on the page
+    (?job=...), or the forecast saved for the file's current version.
+    e.g. ?price=-10&promo=11,12&growth=5
+    """
+    retail_file = get_object_or_404(RetailFile, id=file_id, user=request.user)
     
-    forecast_data = run_sales_forecast(df, sales_col, month_col, year_col)
-    # --- END OF NEW LOGIC ---
+    job_id = request.GET.get('job')
+    if job_id:
+        job = get_object_or_404(BackgroundJob, id=job_id, user=request.user, task='run_sales_forecast',
+                                args_json__retail_file_id=retail_file.id)
+        forecast_data = job.result_json
+    else:
+        forecast_data = get_saved_sales_forecast(retail_file)
     
-    # 5. Pass data to template
-    if "error" in forecast_data:
-        return render(request, 'hub/retail_forecast.html', {
-            'file': retail_file, 
-            'error': f"Forecast Failed: {forecast_data.get('error')}"
-        })
+    if not forecast_data or "error" in forecast_data:
+        return JsonResponse({"error": "Run the forecast first."}, status=404)
 
-    return render(request, 'hub/retail_forecast.html', {
-        'file': retail_file,
-        'forecast_data_for_template': forecast_data # Pass the raw Python dict
+    try:
+        growth = request.GET.get('growth', '').strip()
+        scenario = simulate_scenarios(
+            forecast_data,
+            paths=min(max(int(request.GET.get('paths') or 10000), 100), 50000),
+            price_change_pct=float(request.GET.get('price') or 0),
+            price_elasticity=float(request.GET.get('elasticity') or -1),
+            promo_months=[int(month) for month in request.GET.get('promo', '').split(',') if month.strip()],
+            promo_uplift_pct=float(request.GET.get('promo_uplift') or 10),
+            growth_override_pct=float(growth) if growth else None,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": f"Invalid scenario: {e}"}, status=400)
+    return JsonResponse(scenario)
+
+
+def get_segment_columns(retail_file):
+    """
+    The columns a forecast can be split by: the file's categorical columns.
+    """
+    return [col for col, dtype in (retail_file.schema_json or {}).items() if dtype == 'category']
+
+
+@login_required
+def retail_forecast_segments_view(request, file_id):
+    """
+    One forecast per value of a column (?segment_col=...), run as a
+    background job; the job status page sends the user back here (?job=...).
+    """
+    retail_file = get_object_or_404(RetailFile, id=file_id, user=request.user)
+
+    job_id = request.GET.get('job')
+    if job_id:
+        job = get_object_or_404(BackgroundJob, id=job_id, user=request.user, task='run_segmented_forecast',
+                                args_json__retail_file_id=retail_file.id)
+        if job.status == 'failed':
+            return render(request, 'hub/retail_forecast_segments.html', {
+                'file': retail_file,
+                'error': f"Segmented Forecast Failed: {job.error}"
+            })
+        if job.status == 'done':
+            segment_data = job.result_json
+            if "error" in segment_data:
+                return render(request, 'hub/retail_forecast_segments.html', {
+                    'file': retail_file,
+                    'error': segment_data.get('error')
+                })
+            for segment in segment_data["segments"]:
+                if "error" not in segment:
+                    segment["total"] = sum(segment["forecast_values"])
+                    segment["lower_total"] = sum(segment["lower_ci"])
+                    segment["upper_total"] = sum(segment["upper_ci"])
+            return render(request, 'hub/retail_forecast_segments.html', {
+                'file': retail_file,
+                'segment_data': segment_data
+            })
+        return redirect('job_status', job_id=job.id)
+
+    segment_col = request.GET.get('segment_col')
+    if segment_col not in get_segment_columns(retail_file):
+        return redirect('retail_forecast', file_id=retail_file.id)
+
+    fail_stale_jobs()
+    job = BackgroundJob.objects.filter(
+        user=request.user, task='run_segmented_forecast', args_json__retail_file_id=retail_file.id,
+        args_json__segment_col=segment_col, status__in=['queued', 'running'],
+    ).first()
+    if job is None:
+        job = enqueue_job(request.user, 'run_segmented_forecast', retail_file_id=retail_file.id, segment_col=segment_col)
+        job.next_url = f"{reverse('retail_forecast_segments', args=[retail_file.id])}?job={job.id}"
+        job.save(update_fields=['next_url'])
+    return redirect('job_status', job_id=job.id)
+# --- END NEW SIMULATION VIEW FUNCTION ---
+
+
+# --- BACKGROUND JOB STATUS ---
+@login_required
+def job_status_view(request, job_id):
+    """
+    The "please wait" page: polls job_status_json_view until the job is
+    finished, then goes to the job's result page.
+    """
+    job = get_object_or_404(BackgroundJob, id=job_id, user=request.user)
+    if job.is_finished and job.next_url:
+        return redirect(job.next_url)
+    return render(request, 'hub/job_status.html', {'job': job})
+
+@login_required
+def job_status_json_view(request, job_id):
+    job = get_object_or_404(BackgroundJob, id=job_id, user=request.user)
+    return JsonResponse({
+        "id": job.id,
+        "task": job.task,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result_json if job.status == 'done' else None,
+        "error": job.error,
+        "next_url": job.next_url,
     })
-# --- END NEW SIMULATION VIEW FUNCTION ---
\ No newline at end of file